@@ -0,0 +1,79 @@
+import threading
+import time
+from typing import Callable
+from assistants.managerStructure import ManagerStructure
+
+
+class BackendRegistry():
+
+    def __init__(self, retry_interval: float = 30.0):
+        # seconds to wait before trying to create a backend again after it failed
+        self.retry_interval = retry_interval
+
+        self.factories: dict[str, Callable[[], ManagerStructure]] = {}
+        # backends that may need the user to create them, e.g. to log in, say here whether they can start on their own
+        self.unattended_checks: dict[str, Callable[[], bool]] = {}
+        self.backends: dict[str, ManagerStructure] = {}
+        self.errors: dict[str, tuple[Exception, float]] = {}
+        self.locks: dict[str, threading.Lock] = {}
+
+    def register(self, name: str, factory: Callable[[], ManagerStructure], can_start_unattended: Callable[[], bool] | None = None):
+        self.factories[name] = factory
+        self.locks[name] = threading.Lock()
+        if can_start_unattended is not None:
+            self.unattended_checks[name] = can_start_unattended
+
+    def names(self) -> list[str]:
+        return list(self.factories.keys())
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self.backends
+
+    def can_start_unattended(self, name: str) -> bool:
+        # whether get can create the backend from a background thread without asking the user for anything
+        if name in self.backends:
+            return True
+        check = self.unattended_checks.get(name)
+        return check is None or check()
+
+    def get(self, name: str) -> ManagerStructure:
+        if name in self.backends:
+            return self.backends[name]
+        if name not in self.factories:
+            raise Exception(f"there is no backend called {name}")
+
+        # every backend has its own lock, so a slow or failing backend does not hold up the others
+        with self.locks[name]:
+            if name in self.backends:
+                return self.backends[name]
+
+            if name in self.errors:
+                error, failed_at = self.errors[name]
+                if time.monotonic() - failed_at < self.retry_interval:
+                    raise error
+
+            try:
+                backend = self.factories[name]()
+            except Exception as error:
+                self.errors[name] = (error, time.monotonic())
+                raise
+
+            self.errors.pop(name, None)
+            self.backends[name] = backend
+            return backend
+
+    def warm_up(self, names: list[str] | None = None):
+        # creates the backends in the background, errors are kept until the backend is requested,
+        # the ones that need the user, e.g. for a login, wait until a task is assigned to them
+        for name in names if names is not None else self.names():
+            if not self.can_start_unattended(name):
+                continue
+            thread = threading.Thread(target = self.try_get, args = (name,), daemon = True)
+            thread.start()
+
+    def try_get(self, name: str) -> ManagerStructure | None:
+        try:
+            return self.get(name)
+        except Exception as error:
+            print(f"Backend {name} could not be started: {error}")
+            return None
@@ -0,0 +1,83 @@
+import datetime
+import os
+import threading
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+
+def utcnow() -> datetime.datetime:
+    # google keeps the expiry as a naive UTC time
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo = None)
+
+
+def write_atomically(path: str, text: str):
+    # a crash while writing leaves the old file in place instead of half a token
+    with open(path + ".tmp", "w") as file:
+        file.write(text)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+
+
+class CredentialManager():
+
+    # Refreshes the google credentials on a background thread before they expire, so no request has
+    # to wait for a refresh. The credentials are refreshed in place, the services built for them stay valid.
+
+    def __init__(self, creds: Credentials, token_path: str | None = "token.json", refresh_margin: float = 300.0, retry_interval: float = 30.0):
+        self.creds = creds
+        # where the refreshed token is saved for the next start, None keeps it in memory only
+        self.token_path = token_path
+        # seconds before the expiry the token is refreshed, google-auth itself refreshes inline
+        # from 225 seconds before the expiry on, so the margin has to be larger than that
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread: threading.Thread | None = None
+        self.refreshes: int = 0
+
+    def can_refresh(self) -> bool:
+        return bool(getattr(self.creds, "refresh_token", None))
+
+    def seconds_left(self) -> float | None:
+        if self.creds.expiry is None:
+            return None
+        return (self.creds.expiry - utcnow()).total_seconds()
+
+    def refresh(self):
+        with self.lock:
+            self.creds.refresh(Request())
+            self.refreshes += 1
+            self.save()
+
+    def save(self):
+        if self.token_path is not None:
+            write_atomically(self.token_path, self.creds.to_json())
+
+    def start(self):
+        # credentials without a refresh token cannot be renewed, there is nothing to watch
+        if self.thread is None and self.can_refresh():
+            self.thread = threading.Thread(target = self.refresh_periodically, daemon = True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def refresh_periodically(self):
+        while not self.stopped.is_set():
+            left = self.seconds_left()
+            if left is None:
+                # no expiry known yet, look again later
+                self.stopped.wait(self.retry_interval * 10)
+                continue
+            if left > self.refresh_margin:
+                self.stopped.wait(left - self.refresh_margin)
+                continue
+            try:
+                self.refresh()
+            except Exception as error:
+                # the token is still valid for a while, so there is time for another try
+                print(f"The google token could not be refreshed: {error}")
+                self.stopped.wait(self.retry_interval)
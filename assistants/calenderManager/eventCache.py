@@ -0,0 +1,103 @@
+import bisect
+import datetime
+import threading
+import time
+
+
+def parse_time(value, default_zone: datetime.tzinfo = datetime.timezone.utc) -> datetime.datetime:
+    # accepts isoformat, iCalendar (YYYYMMDDTHHMMSSZ) and plain dates, times without a zone are taken as default_zone
+    if isinstance(value, datetime.datetime):
+        parsed = value
+    elif isinstance(value, datetime.date):
+        parsed = datetime.datetime.combine(value, datetime.time())
+    else:
+        value = value.strip()
+        try:
+            parsed = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            if "T" in value:
+                parsed = datetime.datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+                if value.endswith("Z"):
+                    parsed = parsed.replace(tzinfo = datetime.timezone.utc)
+            else:
+                parsed = datetime.datetime.strptime(value, "%Y%m%d")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo = default_zone)
+    return parsed
+
+
+def normalize_range(time_from, time_till) -> tuple[str, str]:
+    # equal time ranges written differently by the model end up as the same key
+    try:
+        return (parse_time(time_from).astimezone(datetime.timezone.utc).isoformat(),
+                parse_time(time_till).astimezone(datetime.timezone.utc).isoformat())
+    except (ValueError, TypeError, AttributeError):
+        return str(time_from), str(time_till)
+
+
+class EventCache():
+
+    def __init__(self, min_sync_interval: float = 30.0):
+        # seconds during which the cached events are served without asking the server for changes
+        self.min_sync_interval = min_sync_interval
+
+        self.lock = threading.RLock()
+        self.events: dict[str, tuple[datetime.datetime, datetime.datetime, object]] = {}
+        # interval index: (start, key) sorted by start, together with the longest event duration,
+        # so every event overlapping a range lies between two bisections
+        self.index: list[tuple[datetime.datetime, str]] = []
+        self.max_duration: datetime.timedelta = datetime.timedelta(0)
+
+        self.sync_token: str | None = None
+        self.last_sync: float = 0.0
+        self.is_filled: bool = False
+
+    def needs_sync(self) -> bool:
+        return not self.is_filled or time.monotonic() - self.last_sync > self.min_sync_interval
+
+    def mark_synced(self, sync_token: str | None):
+        with self.lock:
+            self.sync_token = sync_token
+            self.last_sync = time.monotonic()
+            self.is_filled = True
+
+    def clear(self):
+        with self.lock:
+            self.events = {}
+            self.index = []
+            self.max_duration = datetime.timedelta(0)
+            self.sync_token = None
+            self.is_filled = False
+
+    def upsert(self, key: str, start, end, event):
+        start = parse_time(start)
+        end = parse_time(end)
+        with self.lock:
+            self.remove(key)
+            self.events[key] = (start, end, event)
+            bisect.insort(self.index, (start, key))
+            self.max_duration = max(self.max_duration, end - start)
+
+    def remove(self, key: str):
+        with self.lock:
+            if key not in self.events:
+                return
+            start, end, _ = self.events.pop(key)
+            position = bisect.bisect_left(self.index, (start, key))
+            del self.index[position]
+            if end - start >= self.max_duration:
+                # the longest event is gone, otherwise one long event would widen every later query for good
+                self.max_duration = max((other_end - other_start for other_start, other_end, _ in self.events.values()), default = datetime.timedelta(0))
+
+    def query(self, time_from, time_till) -> list:
+        time_from = parse_time(time_from)
+        time_till = parse_time(time_till)
+        with self.lock:
+            low = bisect.bisect_left(self.index, (time_from - self.max_duration, ""))
+            high = bisect.bisect_left(self.index, (time_till, ""))
+            result = []
+            for _, key in self.index[low:high]:
+                start, end, event = self.events[key]
+                if end > time_from or start == time_from:
+                    result.append(event)
+            return result
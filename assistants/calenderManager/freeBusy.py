@@ -0,0 +1,176 @@
+import datetime
+from typing import Iterable
+from zoneinfo import ZoneInfo
+from assistants.calenderManager.eventCache import parse_time
+from assistants.calenderManager.resultShaping import format_events
+from assistants.toolRegistry import tool
+
+Interval = tuple[datetime.datetime, datetime.datetime]
+
+SLOT_LIMIT = 20
+# the zone of times the model writes without an offset, the same one put_event writes them in
+DEFAULT_ZONE = ZoneInfo("Europe/Berlin")
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> list[Interval]:
+    # one sweep over the intervals sorted by start, overlapping and touching ones become one
+    merged: list[Interval] = []
+    for (start, end) in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def working_windows(start: datetime.datetime, end: datetime.datetime, day_start: datetime.time, day_end: datetime.time) -> list[Interval]:
+    # the part of every day between day_start and day_end, in the time zone the range was given in
+    windows = []
+    day = start.date()
+    while day <= end.date():
+        window_start = datetime.datetime.combine(day, day_start, tzinfo = start.tzinfo)
+        window_end = datetime.datetime.combine(day, day_end, tzinfo = start.tzinfo)
+        if window_end > start and window_start < end:
+            windows.append((max(window_start, start), min(window_end, end)))
+        day += datetime.timedelta(days = 1)
+    return windows
+
+
+def intersect(first: list[Interval], second: list[Interval]) -> list[Interval]:
+    # both lists are sorted and free of overlaps, so one pass with two cursors is enough
+    result = []
+    (i, j) = (0, 0)
+    while i < len(first) and j < len(second):
+        start = max(first[i][0], second[j][0])
+        end = min(first[i][1], second[j][1])
+        if start < end:
+            result.append((start, end))
+        if first[i][1] < second[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def free_slots(
+    busy: Iterable[Interval],
+    start: datetime.datetime,
+    end: datetime.datetime,
+    min_duration: datetime.timedelta,
+    day_start: datetime.time | None = None,
+    day_end: datetime.time | None = None,
+) -> list[Interval]:
+    # the events keep the offsets they were written with, so everything is moved to the zone of start first
+    zone = start.tzinfo
+    end = end.astimezone(zone)
+    busy = [(busy_start.astimezone(zone), busy_end.astimezone(zone)) for (busy_start, busy_end) in busy]
+    gaps = []
+    cursor = start
+    for (busy_start, busy_end) in merge_intervals((max(s, start), min(e, end)) for (s, e) in busy if e > start and s < end):
+        if busy_start > cursor:
+            gaps.append((cursor, busy_start))
+        cursor = max(cursor, busy_end)
+    if cursor < end:
+        gaps.append((cursor, end))
+
+    if day_start is not None and day_end is not None:
+        gaps = intersect(gaps, working_windows(start, end, day_start, day_end))
+    return [(gap_start, gap_end) for (gap_start, gap_end) in gaps if gap_end - gap_start >= min_duration]
+
+
+def format_slots(slots: list[Interval], min_duration: datetime.timedelta, limit: int = SLOT_LIMIT) -> str:
+    if len(slots) == 0:
+        return f"There is no free slot of at least {int(min_duration.total_seconds() // 60)} minutes in this time range."
+    lines = []
+    for (start, end) in slots[:limit]:
+        minutes = int((end - start).total_seconds() // 60)
+        if start.date() == end.date() and start.utcoffset() == end.utcoffset():
+            lines.append(f"{start:%Y-%m-%d %H:%M}-{end:%H:%M}{format_offset(start)} ({minutes} min)")
+        else:
+            lines.append(f"{start:%Y-%m-%d %H:%M}{format_offset(start)} - {end:%Y-%m-%d %H:%M}{format_offset(end)} ({minutes} min)")
+    if len(slots) > limit:
+        lines.append(f"... and {len(slots) - limit} more free slots.")
+    return f"{len(slots)} free slots:\n" + "\n".join(lines)
+
+
+def format_offset(moment: datetime.datetime) -> str:
+    # +01:00 like in isoformat, so the model can write the times back as they are
+    offset = moment.strftime("%z")
+    return f"{offset[:3]}:{offset[3:5]}"
+
+
+def parse_query_time(value) -> datetime.datetime:
+    return parse_time(value, DEFAULT_ZONE)
+
+
+def event_time(value):
+    # google keeps the time in dateTime and all-day events in date
+    if isinstance(value, dict):
+        return value.get("dateTime", value.get("date"))
+    return value
+
+
+def event_interval(event: dict) -> Interval | None:
+    # events without readable times, e.g. "Unknown start time", do not block anything
+    try:
+        return parse_time(event_time(event["start"])), parse_time(event_time(event["end"]))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def parse_clock(value: str) -> datetime.time:
+    # HH:MM, also with a single digit hour like 8:00
+    return datetime.time(*(int(part) for part in value.strip().split(":")))
+
+
+class FreeBusyTools():
+
+    # free/busy tools for any calendar with get_events and busy_intervals,
+    # the model gets the computed slots instead of the raw events to reason over
+
+    def busy_intervals(self, time_from, time_till) -> list[Interval]:
+        events = self.get_events(time_from, time_till, max_results = None)
+        if events is None:
+            raise RuntimeError("the events could not be loaded")
+        intervals = [event_interval(event) for event in self.busy_events(events)]
+        return [interval for interval in intervals if interval is not None]
+
+    def busy_events(self, events: list) -> list:
+        # google events may be marked as not blocking time
+        return [event for event in events if event.get("transparency") != "transparent"]
+
+    @tool(
+        "find_free_slots",
+        "Find the free time slots of at least duration_minutes in the specified time range. time_from and time_till have to be in isoformat. Only the time between day_start and day_end (HH:MM) of every day is considered.",
+        read_only = True,
+        failure = "The free slots could not be found",
+    )
+    def find_free_slots(self, time_from: str, time_till: str, duration_minutes: int = 30, day_start: str = "08:00", day_end: str = "20:00") -> str:
+        start = parse_query_time(time_from)
+        end = parse_query_time(time_till)
+        min_duration = datetime.timedelta(minutes = duration_minutes)
+        busy = self.busy_intervals(start.isoformat(), end.isoformat())
+        slots = free_slots(busy, start, end, min_duration, parse_clock(day_start), parse_clock(day_end))
+        return format_slots(slots, min_duration)
+
+    @tool(
+        "check_conflicts",
+        "Check whether anything in the calendar overlaps the specified time range, e.g. before adding an event. time_from and time_till have to be in isoformat.",
+        read_only = True,
+        failure = "The conflicts could not be checked",
+    )
+    def check_conflicts(self, time_from: str, time_till: str) -> str:
+        start = parse_query_time(time_from)
+        end = parse_query_time(time_till)
+        events = self.get_events(start.isoformat(), end.isoformat(), max_results = None)
+        if events is None:
+            raise RuntimeError("the events could not be loaded")
+        conflicts = []
+        for event in self.busy_events(events):
+            interval = event_interval(event)
+            if interval is not None and interval[0] < end and interval[1] > start:
+                conflicts.append(event)
+        if len(conflicts) == 0:
+            return "There are no conflicts, the time range is free."
+        return f"Conflicts with {len(conflicts)} events. " + format_events(conflicts)
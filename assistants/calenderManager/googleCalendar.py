@@ -1,12 +1,23 @@
 import os
 import os.path
 from dotenv import load_dotenv
-from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from assistants.managerStructure import ManagerStructure
+from googleapiclient.errors import HttpError
+from assistants.calenderManager.googleService import get_calendar_service
+from assistants.calenderManager.credentialManager import CredentialManager
+from assistants.calenderManager.eventCache import EventCache, parse_time, normalize_range
+from assistants.calenderManager.resultShaping import format_event, format_events, format_batch_results
+from assistants.calenderManager.freeBusy import FreeBusyTools
+from assistants.managerStructure import ManagerStructure, ManagerState
+from assistants.tracing import get_tracer
+from assistants.toolRegistry import tool
+from assistants.singleFlight import SingleFlight
+from assistants.requestScheduler import RequestScheduler, RetryLater, BULK, RETRY_STATUSES, THROTTLE_STATUSES, parse_retry_after
+from assistants.calenderManager.prefetch import PrefetchCache
 import datetime
+import itertools
+import threading
 
 # color_ids:
 """
@@ -24,43 +35,125 @@ red / Tomate: 11
 """
 
 
-class GoogleCalendar(ManagerStructure):
-
-    def __init__(self):
+# only the parts of an event the tools work with are transferred
+EVENT_FIELDS = "id,status,summary,description,colorId,start,end,transparency"
+DEFAULT_MAX_RESULTS = 100
+# google accepts at most 50 requests in one batch
+BATCH_SIZE = 50
+# events per page when a whole prefetch window is read, google allows up to 2500
+PREFETCH_PAGE_SIZE = 250
+# the default quota of the calendar API is 600 requests per minute and user
+REQUESTS_PER_SECOND = 10.0
+REQUEST_BURST = 20
+MAX_CONCURRENT_REQUESTS = 8
+# days before and after today the local copy holds, recurring events without an end are expanded only this far
+SYNC_DAYS_BEFORE = 90
+SYNC_DAYS_AFTER = 365
+# If modifying these scopes, delete the file token.json.
+SCOPES = ['https://www.googleapis.com/auth/calendar']
+# google also reports an exhausted quota as 403 with one of these reasons
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded")
+
+# schemas of the items of the bulk tools
+EVENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "description": {"type": "string"},
+        "time_from": {"type": "string"},
+        "time_till": {"type": "string"},
+        "color_id": {"type": "string"},
+    },
+    "required": ["summary","time_from","time_till"],
+}
+EDIT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "event_id": {"type": "string"},
+        "time_from": {"type": "string"},
+        "time_till": {"type": "string"},
+        "summary": {"type": "string"},
+        "description": {"type": "string"},
+        "color_id": {"type": "string"},
+    },
+    "required": ["event_id"],
+}
+
+
+def is_throttled(error: HttpError) -> bool:
+    # over quota, the whole backend pauses
+    status = error.resp.status
+    if status in THROTTLE_STATUSES:
+        return True
+    return status == 403 and any(reason in str(error.content) for reason in RATE_LIMIT_REASONS)
+
+
+def is_retryable(error: HttpError) -> bool:
+    return is_throttled(error) or error.resp.status in RETRY_STATUSES
+
+
+def has_saved_login(token_path: str = 'token.json') -> bool:
+    # whether the backend can start from the saved token, without opening the login in the browser
+    if not os.path.exists(token_path):
+        return False
+    try:
+        creds = Credentials.from_authorized_user_file(token_path, SCOPES)
+    except (ValueError, OSError):
+        return False
+    return creds.valid or bool(creds.expired and creds.refresh_token)
+
+
+class GoogleCalendar(FreeBusyTools, ManagerStructure):
+
+    def __init__(self, use_cache: bool = True, creds: Credentials | None = None, api_endpoint: str | None = None):
         super().__init__()
         # Load environment variables from .env file
         load_dotenv()
-        
-        # If modifying these scopes, delete the file token.json.
-        SCOPES = ['https://www.googleapis.com/auth/calendar']
 
-        self.creds = None
+        # another server speaking the calendar API, e.g. a local stand-in for benchmarks
+        self.api_endpoint = api_endpoint
+
+        self.creds = creds
         # The file token.json stores the user's access and refresh tokens, and is
         # created automatically when the authorization flow completes for the first time.
 
-        if os.path.exists('token.json'):
+        if self.creds is None and os.path.exists('token.json'):
             self.creds = Credentials.from_authorized_user_file('token.json', SCOPES)
         # If there are no (valid) credentials available, let the user log in.
+        logged_in = False
         if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                self.creds.refresh(Request())
-            else:
+            if not (self.creds and self.creds.expired and self.creds.refresh_token):
                 flow = InstalledAppFlow.from_client_secrets_file(
                     'credentials.json', SCOPES)
                 self.creds = flow.run_local_server(port=0)
-            # Save the credentials for the next run
-            with open('token.json', 'w') as token:
-                token.write(self.creds.to_json())
-
-        for tool in [
-            self.define_function_get_events(),
-            self.define_function_put_event(),
-            self.define_function_delete_event(),
-            self.define_function_edit_event(),
-            self.define_function_call_for_help()
-        ]:
-            self.tools.append(tool)
-        
+                logged_in = True
+
+        # keeps the token fresh in the background and saves every new one for the next run
+        self.credentials: CredentialManager = CredentialManager(self.creds, token_path = 'token.json')
+        if logged_in:
+            self.credentials.save()
+        elif not self.creds.valid:
+            # expired while the assistant was not running, the only refresh anyone waits for
+            # and it happens when the backend is created, before the first turn if it is warmed up
+            self.credentials.refresh()
+        self.credentials.start()
+
+        # local copy of the calendar, kept current with sync tokens
+        self.use_cache = use_cache
+        self.cache: EventCache = EventCache()
+        # one sync talks to google at a time, the cache stays readable meanwhile
+        self.sync_lock = threading.Lock()
+        # the range the last full sync loaded, reads outside of it go to google
+        self.synced_window: tuple[datetime.datetime, datetime.datetime] | None = None
+        # the day the synced range is laid around
+        self.sync_anchor = datetime.date.today
+        # every request to google waits here for its share of the quota
+        self.scheduler: RequestScheduler = RequestScheduler("Google", rate = REQUESTS_PER_SECOND, burst = REQUEST_BURST, max_concurrency = MAX_CONCURRENT_REQUESTS)
+        # identical reads of several sessions or tool calls that overlap share one request
+        self.reads: SingleFlight = SingleFlight()
+        # reads the assistant starts ahead of the model, see LLMAssistant.prefetch
+        self.prefetched: PrefetchCache = PrefetchCache("Google")
+
         self.today = datetime.datetime.now().isoformat()
         self.prompt = f"""
 You are a helpful dialogue-assistant with tool calling capabilities, that allow you to access and change a calendar. Your ONLY purpose is to manage the users Google Calendar and nothing else.
@@ -78,10 +171,6 @@ Here are the different color_ids you should use:
 '8' - grey and used when unsure",
 
 """
-        self.messages: list[dict[str,str]] = [{
-                "role": "system",
-                "content": self.prompt
-            }]
 
     def define_tools(self) -> list[str]:
         return self.tools
@@ -89,263 +178,375 @@ Here are the different color_ids you should use:
     def define_prompt(self) -> str:
         return self.prompt
 
-    def get_events(self, time_from, time_till):
+    def event_bounds(self, event: dict) -> tuple[str, str]:
+        # all-day events only have a date instead of a dateTime
+        start = event["start"].get("dateTime", event["start"].get("date"))
+        end = event["end"].get("dateTime", event["end"].get("date"))
+        return start, end
+
+    def execute(self, request, name: str, cost: int = 1, priority: int | None = None):
+        return self.scheduler.run(self.send, request, name, cost = cost, priority = priority)
+
+    def send(self, request, name: str):
+        with get_tracer().span("backend", f"google.{name}"):
+            try:
+                return request.execute()
+            except HttpError as error:
+                if is_retryable(error):
+                    raise RetryLater(parse_retry_after(error.resp.get("retry-after")), error = error, pause_backend = is_throttled(error)) from error
+                raise
+
+    def cache_event(self, event: dict):
+        if event is None:
+            return
+        if event.get("status") == "cancelled":
+            self.cache.remove(event["id"])
+        else:
+            start, end = self.event_bounds(event)
+            self.cache.upsert(event["id"], start, end, event)
+
+    def sync_window(self) -> tuple[datetime.datetime, datetime.datetime]:
+        today = datetime.datetime.combine(self.sync_anchor(), datetime.time(), tzinfo = datetime.timezone.utc)
+        return today - datetime.timedelta(days = SYNC_DAYS_BEFORE), today + datetime.timedelta(days = SYNC_DAYS_AFTER)
+
+    def fetch_changes(self, sync_token: str | None, window: tuple[datetime.datetime, datetime.datetime] | None) -> tuple[list[dict], str | None]:
+        # the first request lists the synced range, later ones only what changed since the sync token
+        service = get_calendar_service(self.creds, self.api_endpoint)
+        bounds = {} if window is None else {"timeMin": window[0].isoformat(), "timeMax": window[1].isoformat()}
+        events = []
+        page_token = None
+        while True:
+            events_result = self.execute(service.events().list(calendarId='primary', singleEvents=True, maxResults=250,
+                                                    syncToken=sync_token, pageToken=page_token, **bounds,
+                                                    fields=f"nextPageToken,nextSyncToken,items({EVENT_FIELDS})"), "events.sync")
+            events.extend(events_result.get('items', []))
+            page_token = events_result.get('nextPageToken')
+            if page_token is None:
+                return events, events_result.get('nextSyncToken')
+
+    def sync_events(self):
+        with self.sync_lock:
+            if not self.cache.needs_sync():
+                # synced by another read while this one waited
+                return
+            sync_token = self.cache.sync_token
+            window = None if sync_token is not None else self.sync_window()
+            try:
+                events, next_sync_token = self.fetch_changes(sync_token, window)
+            except HttpError as error:
+                if error.resp.status != 410 or sync_token is None:
+                    raise
+                # the sync token expired, start over with a full sync
+                window = self.sync_window()
+                events, next_sync_token = self.fetch_changes(None, window)
+
+            # only applying the answer holds the cache, the requests above did not
+            with self.cache.lock:
+                if window is not None:
+                    self.cache.clear()
+                    self.synced_window = window
+                for event in events:
+                    self.cache_event(event)
+                self.cache.mark_synced(next_sync_token)
+
+    def is_synced(self, time_from, time_till) -> bool:
+        if self.synced_window is None:
+            return False
         try:
-            service = build('calendar', 'v3', credentials=self.creds)
+            return self.synced_window[0] <= parse_time(time_from) and parse_time(time_till) <= self.synced_window[1]
+        except (ValueError, TypeError, AttributeError):
+            return False
+
+    def iter_events(self, time_from, time_till, limit = None, page_size = 50, fields = EVENT_FIELDS):
+        # yields the events page by page and stops asking for pages once the limit is reached
+        service = get_calendar_service(self.creds, self.api_endpoint)
+        time_point_start = parse_time(time_from).isoformat()
+        time_point_end = parse_time(time_till).isoformat()
+
+        page_token = None
+        count = 0
+        while True:
+            page_limit = page_size if limit is None else min(page_size, limit - count)
+            request = service.events().list(calendarId='primary', timeMin = time_point_start, timeMax = time_point_end, 
+                                            maxResults=page_limit, singleEvents=True, orderBy='startTime',
+                                            pageToken=page_token, fields=f"nextPageToken,items({fields})")
+            events_result = self.execute(request, "events.list")
+            for event in events_result.get('items', []):
+                yield event
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+
+            page_token = events_result.get('nextPageToken')
+            if page_token is None:
+                return
+
+    def get_events(self, time_from, time_till, max_results = DEFAULT_MAX_RESULTS):
+        # a read started while the model was still generating answers it when its window covers the range
+        events = self.prefetched.lookup(time_from, time_till, max_results)
+        if events is not None:
+            return events
+        key = ("primary", *normalize_range(time_from, time_till), max_results)
+        return self.reads.do(key, self.load_events, time_from, time_till, max_results)
 
-            # Call the Calendar API
-            time_point_start = time_from if "Z" in time_from else time_from + 'Z'
-            time_point_end = time_till if "Z" in time_till else time_till + 'Z'
+    def prefetch_events(self, start: datetime.datetime, end: datetime.datetime):
+        # the window is read in one large page, so it is ready before the model asks for a part of it
+        self.prefetched.fill(start, end, self.load_events, start.isoformat(), end.isoformat(), None, PREFETCH_PAGE_SIZE)
 
-            events_result = service.events().list(calendarId='primary', timeMin = time_point_start, timeMax = time_point_end, 
-                                                    maxResults=3, singleEvents=True,
-                                                    orderBy='startTime').execute()
-            events = events_result.get('items', [])
+    def invalidate_reads(self):
+        self.prefetched.clear()
 
-            if not events:
-                return []
-            
-            return events
+    def load_events(self, time_from, time_till, max_results = DEFAULT_MAX_RESULTS, page_size = 50):
+        try:
+            if self.use_cache:
+                if self.cache.needs_sync():
+                    self.sync_events()
+                if self.is_synced(time_from, time_till):
+                    return list(itertools.islice(self.cache.query(time_from, time_till), max_results))
+
+            return list(self.iter_events(time_from, time_till, limit = max_results, page_size = page_size))
             
         except Exception as error:
             print(f'An error occurred: {error}')
 
 
+    def busy_intervals(self, time_from, time_till):
+        if self.use_cache:
+            return super().busy_intervals(time_from, time_till)
+
+        # without a local copy google merges the busy times itself and sends no event details
+        service = get_calendar_service(self.creds, self.api_endpoint)
+        body = {
+            "timeMin": parse_time(time_from).isoformat(),
+            "timeMax": parse_time(time_till).isoformat(),
+            "items": [{"id": "primary"}],
+        }
+        result = self.execute(service.freebusy().query(body = body), "freebusy")
+        return [(parse_time(busy["start"]), parse_time(busy["end"])) for busy in result["calendars"]["primary"]["busy"]]
+
     def put_event(self, summary, time_from, time_till, description = None, color_id = None):
-        try:
-            service = build('calendar', 'v3', credentials=self.creds)
-
-            # Call the Calendar API
-            # now = datetime.datetime.utcnow().isoformat() + 'Z'  # 'Z' indicates UTC time
-            time_point_start = time_from
-            time_point_end = time_till
-
-            event = {
-                'summary': summary,
-                "description": description if description != None else "",
-                'start': {
-                    'dateTime': time_point_start,  # Adjust to your local time and format
-                    'timeZone': 'Europe/Berlin',
-                },
-                'end': {
-                    'dateTime': time_point_end,
-                    'timeZone': 'Europe/Berlin',
-                },
-                "colorId": color_id if color_id != None else "8",
-                "reminders": {
-                    "useDefault": True,
-                },
-            }
-            if description:
-                event.update()
-            event = service.events().insert(calendarId='primary', body=event).execute()
-
-            return event
+        # errors reach handle_function_call, which reports them with the failure of the tool
+        service = get_calendar_service(self.creds, self.api_endpoint)
 
-        except Exception as error:
-            print(f'An error occurred: {error}')
+        event = self.build_event_body(summary, time_from, time_till, description, color_id)
+        event = self.execute(service.events().insert(calendarId='primary', body=event), "events.insert")
+        self.cache_event(event)
 
-    def delete_event(self, event_id):
-        try:
-            service = build('calendar', 'v3', credentials=self.creds)
-            service.events().delete(calendarId = 'primary', event_id = event_id).execute()
-            return True
-        except Exception as error:
-            print(f'An error occurred: {error}')
-            
-    def edit_event(self, event_id, time_from = None, time_till = None, summary = None, description = None, color_id = None):
-        try:
-            service = build('calendar', 'v3', credentials=self.creds)
-            event = service.events().get(calendarId='primary', event_id=event_id).execute()
+        return event
 
-            start = {
-                'dateTime': time_from,  # Adjust to your local time and format
-                'timeZone': 'Europe/Berlin',
-            } if time_from != None else event["start"]
+    def build_event_body(self, summary, time_from, time_till, description = None, color_id = None) -> dict:
+        time_point_start = time_from
+        time_point_end = time_till
 
-            end = {
-                'dateTime': time_till,  # Adjust to your local time and format
+        event = {
+            'summary': summary,
+            "description": description if description != None else "",
+            'start': {
+                'dateTime': time_point_start,  # Adjust to your local time and format
                 'timeZone': 'Europe/Berlin',
-            } if time_till != None else event["start"]
-
-            
-            event["summary"] = summary if summary != None else event["summary"]
-            event["start"] = start
-            event["end"] = end
-            event["description"] = description if description != None else event["description"]
-            event["colorId"] = color_id if color_id != None else event["colorId"]
-
-            updated_event = service.events().update(calendarId='primary', event_id=event_id, body=event).execute()
-            return updated_event
-        except Exception as error:
-            print(f'An error occurred: {error}')
-            
-    def define_function_get_events(self) -> dict:
-        function = {
-            "type": "function",
-            "function": {
-                "name": "get_events",
-                "description": "Get information about events in the specified time slot. time_from and time_till have to be in isoformat",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "time_from": {"type": "string"},
-                        "time_till": {"type": "string"},
-                    },
-                    "required": ["time_from","time_till"],
-                }
-            }
-        }
-        return function
-
-    def define_function_put_event(self) -> dict:
-        function = {
-            "type": "function",
-            "function": {
-                "name": "put_event",
-                "description": "Add an event with the requested information to the calendar. time_from and time_till have to be in isoformat. color_id needs suit the type of event: '10' - music related, '5' - Friends related, '4' - study related, '8' - when unsure",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "summary": {"type": "string"},
-                        "description": {"type": "string"},
-                        "time_from": {"type": "string"},
-                        "time_till": {"type": "string"},
-                        "color_id": {"type": "string"},
-                    },
-                    "required": ["summary","time_from","time_till"],
-                    # "additionalProperties": False,
-                }
-            }
-        }
-        return function
-
-    def define_function_end_conversation(self) -> dict:
-        function = {
-            "type": "function",
-            "function": {
-                "name": "end_conversation",
-                "description": "End the conversation, but only if it seems appropriate and the user does not have any left questions",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                    },
-                    "required": [],
-                }
-            }
-        }
-        return function
-
-    def define_function_delete_event(self) -> dict:
-        function = {
-            "type": "function",
-            "function": {
-                "name": "delete_event",
-                "description": "Delete an existing event by providing its event_id",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "event_id": {"type": "string"}
-                    },
-                    "required": ["event_id"],
-                }
-            }
-        }
-        return function
-
-    def define_function_edit_event(self) -> dict:
-        function = {
-            "type": "function",
-            "function": {
-                "name": "edit_event",
-                "description": "Edit an existing event by providing its event_id and attributes, that should be changed",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "event_id": {"type": "string"},
-                        "time_from": {"type": "string"},
-                        "time_till": {"type": "string"},
-                        "summary": {"type": "string"},
-                        "description": {"type": "string"},
-                        "color_id": {"type": "string"},
-                    },
-                    "required": ["event_id"],
-                }
-            }
-        }
-        return function
-    
-    def define_function_call_for_help(self) -> dict:
-        function = {
-            "type": "function",
-            "function": {
-                "name": "call_for_help",
-                "description": "Call for help if you cannot help the user with their request because the topic does not concern you.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                    },
-                    "required": [],
-                }
-            }
+            },
+            'end': {
+                'dateTime': time_point_end,
+                'timeZone': 'Europe/Berlin',
+            },
+            "colorId": color_id if color_id != None else "8",
+            "reminders": {
+                "useDefault": True,
+            },
         }
-        return function
-    
-
-    
-    def handle_function_call(self, called_function: str, arguments: dict) -> str:
-        print(f"TRYING TO CALL A FUNCTION NOW ITS '{called_function}'")
-        if called_function == "get_events":
-            events = self.get_events(
-                time_from = arguments["time_from"], 
-                time_till = arguments["time_till"]
-            )
-            if len(events) == 0:
-                return "There are no upcoming events."
-            
+        return event
+
+    def execute_batch(self, requests: list) -> list[dict]:
+        # runs the requests in batches of BATCH_SIZE and reports the outcome of every single one
+        results: list[dict] = [{} for _ in requests]
+        for offset in range(0, len(requests), BATCH_SIZE):
+            pending = list(range(offset, min(offset + BATCH_SIZE, len(requests))))
+            # every request of a batch counts against the quota, and bulk changes wait behind the reads of other sessions
+            self.scheduler.run(self.send_batch, requests, pending, results, cost = len(pending), priority = BULK)
+        return results
+
+    def send_batch(self, requests: list, pending: list[int], results: list[dict]):
+        service = get_calendar_service(self.creds, self.api_endpoint)
+        throttled: list[tuple[int, HttpError]] = []
+
+        def callback(request_id, response, exception):
+            index = int(request_id)
+            if exception is not None:
+                results[index] = {"ok": False, "error": str(exception)}
+                if isinstance(exception, HttpError) and is_retryable(exception):
+                    throttled.append((index, exception))
             else:
-                return f"The events for the asked time are: {events}."
-            
-        elif called_function == "put_event":
-            print("REALLY TRYING TO PUT EVENT")
-            try:
-                print("REALLY TRYING TO PUT EVENT EVEN GOT INTO THE TRY")
-                event = self.put_event(
-                    summary = arguments["summary"], 
-                    time_from = arguments["time_from"], 
-                    time_till = arguments["time_till"],
-                    description = arguments["description"] if "description" in arguments else None,
-                    color_id = arguments["color_id"] if "color_id" in arguments else None
-                )
-                return f"Following event was created: {event}."
-            
-            except Exception as error:
-                return f"The event could not be created because of {error}. Excuse yourself in front of the user."
+                results[index] = {"ok": True, "event": response}
+
+        batch = service.new_batch_http_request(callback = callback)
+        for index in pending:
+            batch.add(requests[index], request_id = str(index))
+        self.send(batch, "batch")
+
+        if throttled:
+            # only the requests that can be retried are sent again, the others went through or failed for good
+            pending[:] = [index for (index, _) in throttled]
+            delays = [parse_retry_after(error.resp.get("retry-after")) for (_, error) in throttled]
+            raise RetryLater(
+                max((delay for delay in delays if delay is not None), default = None),
+                pause_backend = any(is_throttled(error) for (_, error) in throttled),
+            )
+
+    def put_events(self, events: list[dict]) -> list[dict]:
+        service = get_calendar_service(self.creds, self.api_endpoint)
+        requests = [
+            service.events().insert(calendarId='primary', body=self.build_event_body(
+                summary = event["summary"],
+                time_from = event["time_from"],
+                time_till = event["time_till"],
+                description = event.get("description"),
+                color_id = event.get("color_id"),
+            ))
+            for event in events
+        ]
+        results = self.execute_batch(requests)
+        for result in results:
+            if result["ok"]:
+                self.cache_event(result["event"])
+        return results
+
+    def delete_events(self, event_ids: list[str]) -> list[dict]:
+        service = get_calendar_service(self.creds, self.api_endpoint)
+        results = self.execute_batch([service.events().delete(calendarId='primary', eventId=event_id) for event_id in event_ids])
+        for (event_id, result) in zip(event_ids, results):
+            if result["ok"]:
+                self.cache.remove(event_id)
+        return results
+
+    def edit_events(self, edits: list[dict]) -> list[dict]:
+        # patch only sends the changed attributes, so no event has to be read first
+        service = get_calendar_service(self.creds, self.api_endpoint)
+        requests = []
+        for edit in edits:
+            body = {}
+            if edit.get("time_from") is not None:
+                body["start"] = {'dateTime': edit["time_from"], 'timeZone': 'Europe/Berlin'}
+            if edit.get("time_till") is not None:
+                body["end"] = {'dateTime': edit["time_till"], 'timeZone': 'Europe/Berlin'}
+            if edit.get("summary") is not None:
+                body["summary"] = edit["summary"]
+            if edit.get("description") is not None:
+                body["description"] = edit["description"]
+            if edit.get("color_id") is not None:
+                body["colorId"] = edit["color_id"]
+            requests.append(service.events().patch(calendarId='primary', eventId=edit["event_id"], body=body))
+
+        results = self.execute_batch(requests)
+        for result in results:
+            if result["ok"]:
+                self.cache_event(result["event"])
+        return results
+
+    def delete_event(self, event_id):
+        service = get_calendar_service(self.creds, self.api_endpoint)
+        self.execute(service.events().delete(calendarId = 'primary', eventId = event_id), "events.delete")
+        self.cache.remove(event_id)
+        return True
+
+    def edit_event(self, event_id, time_from = None, time_till = None, summary = None, description = None, color_id = None):
+        service = get_calendar_service(self.creds, self.api_endpoint)
+        event = self.execute(service.events().get(calendarId='primary', eventId=event_id), "events.get")
+
+        start = {
+            'dateTime': time_from,  # Adjust to your local time and format
+            'timeZone': 'Europe/Berlin',
+        } if time_from != None else event["start"]
+
+        end = {
+            'dateTime': time_till,  # Adjust to your local time and format
+            'timeZone': 'Europe/Berlin',
+        } if time_till != None else event["end"]
+
         
-        elif called_function == "delete_event":
-            try:
-                self.delete_event(event_id = arguments["event_id"])
-                return "The event was deleted successfully"
-                
-            except Exception as error:
-                return f"The event could not be deleted because of {error}. Excuse yourself in front of the user."
-                
-        elif called_function == "edit_event":
-            try:
-                event = self.edit_event(
-                    event_id = arguments["event_id"],
-                    time_from = arguments["time_from"] if "time_from" in arguments else None,
-                    time_till = arguments["time_till"] if "time_till" in arguments else None,
-                    summary = arguments["summary"] if "summary" in arguments else None,
-                    description = arguments["description"] if "description" in arguments else None,
-                    color_id = arguments["color_id"] if "color_id" in arguments else None
-                )
-                return f"Following event was edited: {event}."
-                
-            except Exception as error:
-                return f"The event could not be edited because of {error}. Excuse yourself in front of the user."
-        elif called_function == "call_for_help":
-            self.assigned_task_to = "Manager"
-            return ""
-        else:
-            return "Something went wrong. The function could not be called"
+        event["summary"] = summary if summary != None else event["summary"]
+        event["start"] = start
+        event["end"] = end
+        event["description"] = description if description != None else event["description"]
+        event["colorId"] = color_id if color_id != None else event["colorId"]
+
+        updated_event = self.execute(service.events().update(calendarId='primary', eventId=event_id, body=event), "events.update")
+        self.cache_event(updated_event)
+        return updated_event
+
+    @tool(
+        "end_conversation",
+        "End the conversation, but only if it seems appropriate and the user does not have any left questions",
+    )
+    def end_conversation(self, state: ManagerState) -> str:
+        state.kill()
+        return "Conversation has been ended. Say goodbye to the user!"
+
+    @tool(
+        "get_events",
+        "Get information about events in the specified time slot. time_from and time_till have to be in isoformat. max_results limits how many events are returned",
+        read_only = True,
+        failure = "The events could not be loaded",
+    )
+    def tool_get_events(self, time_from: str, time_till: str, max_results: int = DEFAULT_MAX_RESULTS) -> str:
+        events = self.get_events(time_from = time_from, time_till = time_till, max_results = max_results)
+        if events is None:
+            return "The events could not be loaded. Excuse yourself in front of the user."
+        if len(events) == 0:
+            return "There are no upcoming events."
+        return format_events(events)
+
+    @tool(
+        "put_event",
+        "Add an event with the requested information to the calendar. time_from and time_till have to be in isoformat. color_id needs suit the type of event: '10' - music related, '5' - Friends related, '4' - study related, '8' - when unsure",
+        failure = "The event could not be created",
+    )
+    def tool_put_event(self, summary: str, time_from: str, time_till: str, description: str | None = None, color_id: str | None = None) -> str:
+        event = self.put_event(summary = summary, time_from = time_from, time_till = time_till, description = description, color_id = color_id)
+        return f"Following event was created: {format_event(event)}."
+
+    @tool("delete_event", "Delete an existing event by providing its event_id", failure = "The event could not be deleted")
+    def tool_delete_event(self, event_id: str) -> str:
+        self.delete_event(event_id = event_id)
+        return "The event was deleted successfully"
+
+    @tool(
+        "edit_event",
+        "Edit an existing event by providing its event_id and attributes, that should be changed",
+        failure = "The event could not be edited",
+    )
+    def tool_edit_event(self, event_id: str, time_from: str | None = None, time_till: str | None = None, summary: str | None = None,
+                        description: str | None = None, color_id: str | None = None) -> str:
+        event = self.edit_event(event_id = event_id, time_from = time_from, time_till = time_till, summary = summary,
+                                description = description, color_id = color_id)
+        return f"Following event was edited: {format_event(event)}."
+
+    @tool(
+        "put_events",
+        "Add several events to the calendar at once. Use this instead of calling put_event several times. Every event needs summary, time_from and time_till in isoformat and can have a description and a color_id.",
+        failure = "The events could not be created",
+        parameters = {"events": {"type": "array", "items": EVENT_SCHEMA}},
+    )
+    def tool_put_events(self, events: list[dict]) -> str:
+        return format_batch_results("Created", self.put_events(events))
+
+    @tool(
+        "delete_events",
+        "Delete several existing events at once by providing their event_ids",
+        failure = "The events could not be deleted",
+    )
+    def tool_delete_events(self, event_ids: list[str]) -> str:
+        return format_batch_results("Deleted", self.delete_events(event_ids))
+
+    @tool(
+        "edit_events",
+        "Edit several existing events at once. Every edit needs the event_id and the attributes that should be changed",
+        failure = "The events could not be edited",
+        parameters = {"edits": {"type": "array", "items": EDIT_SCHEMA}},
+    )
+    def tool_edit_events(self, edits: list[dict]) -> str:
+        return format_batch_results("Edited", self.edit_events(edits))
+
+    @tool("call_for_help", "Call for help if you cannot help the user with their request because the topic does not concern you.")
+    def call_for_help(self, state: ManagerState) -> str:
+        state.assigned_task_to = "Manager"
+        return ""
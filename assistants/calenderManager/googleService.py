@@ -0,0 +1,69 @@
+import json
+import threading
+import weakref
+import httplib2
+import google_auth_httplib2
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import HttpRequest
+
+
+# the discovery document shipped with google-api-python-client, so building a service never goes online
+calendar_discovery_document: dict | None = None
+discovery_lock = threading.Lock()
+
+# one service per credential set and endpoint, shared by every GoogleCalendar and every thread
+services: "weakref.WeakKeyDictionary[Credentials, dict[str | None, object]]" = weakref.WeakKeyDictionary()
+services_lock = threading.Lock()
+
+# httplib2 connections must not be shared between threads, so every thread keeps its own
+thread_local = threading.local()
+
+
+def get_discovery_document() -> dict:
+    global calendar_discovery_document
+    with discovery_lock:
+        if calendar_discovery_document is None:
+            content = get_static_doc("calendar", "v3")
+            if content is None:
+                raise Exception("the static discovery document for calendar v3 is missing")
+            calendar_discovery_document = json.loads(content)
+        return calendar_discovery_document
+
+
+def get_thread_http(creds: Credentials) -> google_auth_httplib2.AuthorizedHttp:
+    # only the connection for the latest credentials is kept, so rotated credentials can be released
+    creds_ref = getattr(thread_local, "creds_ref", None)
+    if creds_ref is None or creds_ref() is not creds:
+        thread_local.creds_ref = weakref.ref(creds)
+        thread_local.http = google_auth_httplib2.AuthorizedHttp(creds, http = httplib2.Http())
+    return thread_local.http
+
+
+def get_calendar_service(creds: Credentials, api_endpoint: str | None = None):
+    with services_lock:
+        # the same credentials can be used against another server, e.g. a stand-in, which needs its own service
+        by_endpoint = services.setdefault(creds, {})
+        if api_endpoint in by_endpoint:
+            return by_endpoint[api_endpoint]
+
+        # the service only holds a weak reference, so it goes away together with the rotated credentials
+        creds_ref = weakref.ref(creds)
+
+        def build_request(http, *args, **kwargs):
+            # every request runs on the connection of the thread that executes it
+            return HttpRequest(get_thread_http(creds_ref()), *args, **kwargs)
+
+        document = get_discovery_document()
+        if api_endpoint is not None:
+            # the root url is swapped in the document itself, so batch requests go to the same server
+            document = {**document, "rootUrl": api_endpoint, "baseUrl": api_endpoint + document["servicePath"]}
+
+        service = build_from_document(
+            document,
+            http = httplib2.Http(),
+            requestBuilder = build_request,
+        )
+        by_endpoint[api_endpoint] = service
+        return service
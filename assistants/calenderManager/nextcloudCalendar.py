@@ -1,25 +1,113 @@
 import os.path
 from dotenv import load_dotenv
-from assistants.managerStructure import ManagerStructure
+from assistants.managerStructure import ManagerStructure, ManagerState
 import datetime
 import json
 import caldav
 import uuid
+import contextvars
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import recurring_ical_events
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from caldav.lib.error import NotFoundError
+from assistants.calenderManager.eventCache import EventCache, parse_time, normalize_range
+from assistants.calenderManager.icsParser import parse_vevents, parse_vevents_batch
+from assistants.calenderManager.resultShaping import format_events, format_batch_results
+from assistants.calenderManager.freeBusy import FreeBusyTools
+from assistants.tracing import get_tracer
+from assistants.toolRegistry import tool
+from assistants.singleFlight import SingleFlight
+from assistants.calenderManager.prefetch import PrefetchCache
+from assistants.keepAlive import KeepAlive
+from assistants.requestScheduler import RequestScheduler, RetryLater, request_priority, BULK, BACKGROUND, RETRY_STATUSES, THROTTLE_STATUSES, parse_retry_after
 
-class NextcloudCalendar(ManagerStructure):
+DEFAULT_MAX_RESULTS = 100
+# number of PUT requests that are sent to the server at the same time
+WRITE_CONCURRENCY = 8
+# connections kept open to the server: the writes, a read and the keep-alive ping
+CONNECTION_POOL_SIZE = WRITE_CONCURRENCY + 2
+# seconds between two pings, below the idle timeout of common servers and proxies
+KEEP_ALIVE_INTERVAL = 30.0
+# what the server is sent at most, a self-hosted Nextcloud has no published quota
+REQUESTS_PER_SECOND = 20.0
+REQUEST_BURST = 40
 
-    def __init__(self):
-        super().__init__()
+# events without a readable start are put at the end
+LAST = datetime.datetime.max.replace(tzinfo = datetime.timezone.utc)
+
+# schema of the items of put_events
+EVENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "description": {"type": "string"},
+        "time_from": {"type": "string"},
+        "time_till": {"type": "string"},
+    },
+    "required": ["summary","time_from","time_till"],
+}
+
+
+def start_key(record: dict) -> datetime.datetime:
+    try:
+        return parse_time(record["start"])
+    except (ValueError, TypeError, AttributeError):
+        return LAST
+
+
+class ScheduledDAVClient(caldav.DAVClient):
+
+    # every request of the caldav library goes through the scheduler, also the ones it sends on its own
 
-        with open('nextcloudCredentials.json') as f:
-            d = json.load(f)
-            
-            self.client = caldav.DAVClient(
-                url = "https://cloud.sympalog.org/remote.php/dav",
-                username = d["login"],
-                password = d["pass"],
+    def __init__(self, scheduler: RequestScheduler, **kwargs):
+        super().__init__(**kwargs)
+        self.scheduler = scheduler
+        self.local = threading.local()
+
+    def request(self, url, method = "GET", body = "", headers = {}):
+        if getattr(self.local, "sending", False):
+            # caldav repeats a request itself after the authentication challenge, that one already has its slot
+            return super().request(url, method, body, headers)
+        return self.scheduler.run(self.send, url, method, body, headers)
+
+    def send(self, url, method, body, headers):
+        self.local.sending = True
+        try:
+            response = super().request(url, method, body, headers)
+        finally:
+            self.local.sending = False
+        if response.status in RETRY_STATUSES:
+            # after the last try caldav gets the response and raises its usual error
+            raise RetryLater(
+                parse_retry_after(response.headers.get("Retry-After")),
+                result = response,
+                pause_backend = response.status in THROTTLE_STATUSES,
             )
-            self.calendar_name = d["calendar_name"]
+        return response
+
+
+class NextcloudCalendar(FreeBusyTools, ManagerStructure):
+
+    def __init__(self, use_cache: bool = True, url: str = "https://cloud.sympalog.org/remote.php/dav", credentials: dict | None = None):
+        super().__init__()
+
+        if credentials is None:
+            with open('nextcloudCredentials.json') as f:
+                credentials = json.load(f)
+
+        d = credentials
+        self.scheduler: RequestScheduler = RequestScheduler("Nextcloud", rate = REQUESTS_PER_SECOND, burst = REQUEST_BURST, max_concurrency = CONNECTION_POOL_SIZE)
+        self.client = ScheduledDAVClient(
+            self.scheduler,
+            url = url,
+            username = d["login"],
+            password = d["pass"],
+        )
+        self.configure_session(self.client.session)
+        self.calendar_name = d["calendar_name"]
         
         calendars = self.client.principal().calendars()
         
@@ -32,12 +120,26 @@ class NextcloudCalendar(ManagerStructure):
             else:
                 self.calendar: caldav.Calendar = calendar
 
-        for tool in [
-            self.define_function_get_events(),
-            self.define_function_put_event(),
-        ]:
-            self.tools.append(tool)
-        
+        # the connection opened above stays open, turns do not wait for a new TLS handshake
+        self.keep_alive: KeepAlive = KeepAlive(f"The Nextcloud server {url}", self.ping, KEEP_ALIVE_INTERVAL)
+        self.keep_alive.start()
+
+        # local copy of the calendar, kept current with sync-collection reports
+        self.use_cache = use_cache
+        self.cache: EventCache = EventCache()
+        # one sync talks to the server at a time, the cache stays readable meanwhile
+        self.sync_lock = threading.Lock()
+        # recurring events are kept as a whole and expanded when they are queried
+        self.recurring_events: dict[str, object] = {}
+        # the cache keys every resource was stored under, one per VEVENT it holds
+        self.cached_keys: dict[str, list[str]] = {}
+        # identical reads of several sessions or tool calls that overlap share one request
+        self.reads: SingleFlight = SingleFlight()
+        # reads the assistant starts ahead of the model, see LLMAssistant.prefetch
+        self.prefetched: PrefetchCache = PrefetchCache("Nextcloud")
+
+        self.write_executor = ThreadPoolExecutor(max_workers = WRITE_CONCURRENCY)
+
         self.today = datetime.datetime.now().strftime("%Y%m%dT%H%M%SZ")
         self.prompt = f"""You are a helpful dialogue-assistant with tool calling capabilities, that allow you to access and change a calendar. 
 Have a pleasant conversation with the user and try to help them with their tasks.
@@ -52,6 +154,27 @@ If you are calling a function: Always put the object inside a list. Do not write
 """
 
     
+    def configure_session(self, session):
+        # a bounded pool of persistent connections instead of requests' default of 10 that are replaced when exceeded,
+        # a connection the server closed while idle is opened again once for the requests that can be repeated
+        retries = Retry(
+            total = 1,
+            connect = 1,
+            read = 1,
+            status = 0,
+            allowed_methods = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "PROPFIND", "REPORT"}),
+            raise_on_status = False,
+        )
+        adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = CONNECTION_POOL_SIZE, pool_block = True, max_retries = retries)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+    def ping(self):
+        with request_priority(BACKGROUND):
+            response = self.client.request(str(self.calendar.url), "OPTIONS")
+        if response.status >= 400:
+            raise Exception(f"status {response.status}")
+
     def get_calendar_by_name(self, calendars: list[caldav.Calendar], name: str) -> caldav.Calendar | None:
         searchedCalendar = None
         if len(calendars) > 0:
@@ -69,162 +192,240 @@ If you are calling a function: Always put the object inside a list. Do not write
     def define_prompt(self) -> str:
         return self.prompt
 
-    def get_events(self, time_from, time_till):
-        print(f"searching from {time_from} until {time_till}")
-        events = self.calendar.date_search(start = time_from, end = time_till)
-        print(f"returned events are {events}")
-        result_events = []
-        for (index, event) in enumerate(events):
-            vevent = event.vobject_instance.vevent
-            print(f"vevent is: {vevent}")
-            summary = vevent.summary.value if hasattr(vevent, 'summary') else "No title"
-            print(f"summary in vevent is: {summary}")
-            dtstart = vevent.dtstart.value if hasattr(vevent, 'dtstart') else "Unknown start time"
-            dtend = vevent.dtend.value if hasattr(vevent, 'dtend') else "Unknown end time"
-            result_events.append(f"Event-{index}: summary is '{summary}' and from {dtstart} until {dtend}")
-        return result_events
+    def read_event(self, event: caldav.Event, vevents: list[dict] | None = None) -> list[dict]:
+        if vevents is None:
+            vevents = parse_vevents(event.data)
+        if not any(vevent["needs_fallback"] for vevent in vevents):
+            return [{
+                "id": vevent["uid"],
+                "summary": vevent["summary"],
+                "description": vevent["description"],
+                "start": vevent["start"] if vevent["start"] is not None else "Unknown start time",
+                "end": vevent["end"] if vevent["end"] is not None else "Unknown end time",
+            } for vevent in vevents]
 
-    def put_event(self, summary, time_from, time_till, description = None):
-        
+        # recurrences and unusual values are left to vobject
+        vevent = event.vobject_instance.vevent
+        summary = vevent.summary.value if hasattr(vevent, 'summary') else "No title"
+        dtstart = vevent.dtstart.value if hasattr(vevent, 'dtstart') else "Unknown start time"
+        dtend = vevent.dtend.value if hasattr(vevent, 'dtend') else "Unknown end time"
+        uid = vevent.uid.value if hasattr(vevent, 'uid') else None
+        description = vevent.description.value if hasattr(vevent, 'description') else None
+        return [{"id": uid, "summary": summary, "description": description, "start": dtstart, "end": dtend}]
+
+    def cache_event(self, event: caldav.Event, vevents: list[dict] | None = None):
+        key = str(event.url.canonical())
+        self.remove_cached_event(key)
+
+        if vevents is None:
+            vevents = parse_vevents(event.data)
+        if any(vevent["needs_fallback"] for vevent in vevents):
+            self.recurring_events[key] = event.icalendar_instance
+            return
+        keys = []
+        with self.cache.lock:
+            for (index, vevent) in enumerate(vevents):
+                if vevent["start"] is not None:
+                    end = vevent["end"] if vevent["end"] is not None else vevent["start"]
+                    self.cache.upsert(f"{key}#{index}", vevent["start"], end, self.read_event(event, [vevent])[0])
+                    keys.append(f"{key}#{index}")
+            self.cached_keys[key] = keys
+
+    def remove_cached_event(self, key: str):
+        # VEVENTs without a start are not cached, so the stored keys are not always numbered without gaps
+        with self.cache.lock:
+            self.recurring_events.pop(key, None)
+            for cached_key in self.cached_keys.pop(key, []):
+                self.cache.remove(cached_key)
+
+    def sync_events(self):
+        with self.sync_lock:
+            if not self.cache.needs_sync():
+                # synced by another read while this one waited
+                return
+            if self.cache.is_filled:
+                try:
+                    self.apply_sync_report(*self.fetch_sync_report(self.cache.sync_token))
+                    return
+                except Exception as error:
+                    print(f"Incremental sync failed, loading the whole calendar again: {error}")
+
+            # the token is taken before the events are loaded, so no change in between is missed
+            with get_tracer().span("backend", "caldav.sync_collection"):
+                sync_token = self.calendar.objects_by_sync_token(load_objects = False).sync_token
+            with get_tracer().span("backend", "caldav.events"):
+                events = self.calendar.events()
+            parsed = parse_vevents_batch([event.data for event in events])
+
+            # only applying the answer holds the cache, the requests above did not
+            with self.cache.lock:
+                self.cache.clear()
+                self.recurring_events = {}
+                self.cached_keys = {}
+                for (event, vevents) in zip(events, parsed):
+                    self.cache_event(event, vevents)
+                self.cache.mark_synced(sync_token)
+
+    def fetch_sync_report(self, sync_token: str) -> tuple[list[caldav.Event], list[str], str]:
+        # the changed events are loaded here, deleted ones show up in the report but cannot be loaded anymore
+        with get_tracer().span("backend", "caldav.sync_collection"):
+            updates = self.calendar.objects_by_sync_token(sync_token, load_objects = False)
+        changed = []
+        deleted = []
+        for event in updates:
+            try:
+                with get_tracer().span("backend", "caldav.get"):
+                    event.load()
+                changed.append(event)
+            except NotFoundError:
+                deleted.append(str(event.url.canonical()))
+        return changed, deleted, updates.sync_token
+
+    def apply_sync_report(self, changed: list[caldav.Event], deleted: list[str], sync_token: str):
+        with self.cache.lock:
+            for event in changed:
+                self.cache_event(event)
+            for key in deleted:
+                self.remove_cached_event(key)
+            self.cache.mark_synced(sync_token)
+
+    def query_cache(self, time_from, time_till) -> list[dict]:
+        start = parse_time(time_from)
+        end = parse_time(time_till)
+        records = self.cache.query(start, end)
+        for calendar in list(self.recurring_events.values()):
+            for occurrence in recurring_ical_events.of(calendar).between(start, end):
+                records.append({
+                    "id": str(occurrence.get("UID")),
+                    "summary": str(occurrence.get("SUMMARY", "No title")),
+                    "description": str(occurrence.get("DESCRIPTION")) if occurrence.get("DESCRIPTION") else None,
+                    "start": occurrence.get("DTSTART").dt,
+                    "end": occurrence.get("DTEND").dt if occurrence.get("DTEND") else occurrence.get("DTSTART").dt,
+                })
+        records.sort(key = start_key)
+        return records
+
+    def iter_events(self, time_from, time_till, limit = None):
+        if self.use_cache:
+            if self.cache.needs_sync():
+                self.sync_events()
+            yield from itertools.islice(self.query_cache(time_from, time_till), limit)
+            return
+
+        # CalDAV has no paging, so the whole range is searched at once and the sorted result is cut at the limit,
+        # one round trip is cheaper than a search per week even when the later weeks are not needed
+        with get_tracer().span("backend", "caldav.date_search"):
+            events = self.calendar.date_search(start = parse_time(time_from), end = parse_time(time_till))
+        records = []
+        for (event, vevents) in zip(events, parse_vevents_batch([event.data for event in events])):
+            records.extend(self.read_event(event, vevents))
+        # the starts are datetimes, dates or strings in different formats, so they are compared as times
+        records.sort(key = start_key)
+        yield from itertools.islice(records, limit)
+
+    def get_events(self, time_from, time_till, max_results = DEFAULT_MAX_RESULTS):
+        # a read started while the model was still generating answers it when its window covers the range
+        events = self.prefetched.lookup(time_from, time_till, max_results)
+        if events is not None:
+            return events
+        key = (self.calendar_name, *normalize_range(time_from, time_till), max_results)
+        return self.reads.do(key, self.load_events, time_from, time_till, max_results)
+
+    def prefetch_events(self, start: datetime.datetime, end: datetime.datetime):
+        self.prefetched.fill(start, end, self.load_events, start.isoformat(), end.isoformat(), None)
+
+    def invalidate_reads(self):
+        self.prefetched.clear()
+
+    def load_events(self, time_from, time_till, max_results = DEFAULT_MAX_RESULTS):
+        return list(self.iter_events(time_from, time_till, limit = max_results))
+
+    def format_ics_time(self, value: str) -> str:
+        # the model sometimes answers in isoformat, CalDAV servers drop a DTSTART that is not in the basic form
         try:
-            self.calendar.add_event(f"""BEGIN:VCALENDAR
+            parsed = datetime.datetime.fromisoformat(value.strip())
+        except ValueError:
+            return value
+        if parsed.tzinfo is None:
+            return parsed.strftime("%Y%m%dT%H%M%S")
+        return parsed.astimezone(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+    def build_ics(self, summary, time_from, time_till, description = None) -> str:
+        return f"""BEGIN:VCALENDAR
 VERSION:2.0
 PRODID:NIKITAS_CALENDAR_ASSISTANT
 BEGIN:VEVENT
 UID:{uuid.uuid4()}-nikitasCustomEvents
 DTSTAMP:{self.today}
-DTSTART:{time_from}
-DTEND:{time_till}
+DTSTART:{self.format_ics_time(time_from)}
+DTEND:{self.format_ics_time(time_till)}
 SUMMARY:{summary} 
 DESCRIPTION:{"no description" if description == None else description}
 END:VEVENT
-END:VCALENDAR""")
-            return "Added event successfully"
-
-        except Exception as error:
-            print(f'An error occurred: {error}')
-
-            
-    def define_function_get_events(self) -> dict:
-        function = {
-            "type": "function",
-            "function": {
-                "name": "get_events",
-                "description": "Get information about events in the specified time slot. time_from and time_till have to be in isoformat.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "time_from": {"type": "string"},
-                        "time_till": {"type": "string"},
-                    },
-                    "required": ["time_from","time_till"],
-                }
-            }
-        }
-        return function
-
-    def define_function_put_event(self) -> dict:
-        function = {
-            "type": "function",
-            "function": {
-                "name": "put_event",
-                "description": "Add an event with the requested information to the calendar. time_from and time_till have to be in iCalendar (ICS) format (YYYYMMDDTHHMMSSZ).",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "summary": {"type": "string"},
-                        "description": {"type": "string"},
-                        "time_from": {"type": "string"},
-                        "time_till": {"type": "string"},
-                    },
-                    "required": ["summary","time_from","time_till"],
-                }
-            }
-        }
-        return function
-
-    def define_function_end_conversation(self) -> dict:
-        function = {
-            "type": "function",
-            "function": {
-                "name": "end_conversation",
-                "description": "End the conversation, but only if it seems appropriate and the user does not have any left questions",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                    },
-                    "required": [],
-                }
-            }
-        }
-        return function
-
-    def define_function_delete_event(self) -> dict:
-        function = {
-            "type": "function",
-            "function": {
-                "name": "delete_event",
-                "description": "Delete an existing event by providing its event_id",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "event_id": {"type": "string"}
-                    },
-                    "required": ["event_id"],
-                }
-            }
-        }
-        return function
-
-    def define_function_edit_event(self) -> dict:
-        function = {
-            "type": "function",
-            "function": {
-                "name": "edit_event",
-                "description": "Edit an existing event by providing its event_id and attributes, that should be changed",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "event_id": {"type": "string"},
-                        "time_from": {"type": "string"},
-                        "time_till": {"type": "string"},
-                        "summary": {"type": "string"},
-                        "description": {"type": "string"},
-                        "color_id": {"type": "string"},
-                    },
-                    "required": ["event_id"],
-                }
-            }
-        }
-        return function
-    
-    def handle_function_call(self, called_function: str, arguments: dict) -> str:
+END:VCALENDAR"""
 
-        if called_function == "put_event":
-            try:
-                self.put_event(
-                    summary = arguments["summary"], 
-                    time_from = arguments["time_from"], 
-                    time_till = arguments["time_till"],
-                    description = arguments["description"] if "description" in arguments else None,
-                )
-                return "The event was created successfully."
-            
-            except Exception as error:
-                return f"The event could not be created because of {error}. Excuse yourself in front of the user."
-            
-        elif called_function == "get_events":
+    def put_event(self, summary, time_from, time_till, description = None):
+        # errors reach handle_function_call, which reports them with the failure of the tool
+        with get_tracer().span("backend", "caldav.put"):
+            event = self.calendar.add_event(self.build_ics(summary, time_from, time_till, description))
+        if self.cache.is_filled:
+            self.cache_event(event)
+        return "Added event successfully"
+
+    def put_events(self, events: list[dict]) -> list[dict]:
+        # CalDAV has no batch request, so the PUTs are sent side by side over the pooled connections
+        def put(event: dict) -> dict:
             try:
-                events = self.get_events(
-                    time_from = arguments["time_from"], 
-                    time_till = arguments["time_till"],
-                )
-                return f"Following events were found: {events}."
-            
+                with get_tracer().span("backend", "caldav.put"):
+                    created = self.calendar.add_event(self.build_ics(
+                        summary = event["summary"],
+                        time_from = event["time_from"],
+                        time_till = event["time_till"],
+                        description = event.get("description"),
+                    ))
+                if self.cache.is_filled:
+                    self.cache_event(created)
+                return {"ok": True, "event": self.read_event(created)[0]}
             except Exception as error:
-                return f"Events could not be found because of {error}. Excuse yourself in front of the user."
-            
-        else:
-            return "The called function does not exist. DO NOT try again!"
-        
-                
+                return {"ok": False, "error": str(error)}
+
+        # every PUT gets its own copy of the context, so its span still belongs to the current turn
+        # and it waits in the bulk lane of the scheduler
+        with request_priority(BULK):
+            futures = [self.write_executor.submit(contextvars.copy_context().run, put, event) for event in events]
+        return [future.result() for future in futures]
+
+    @tool(
+        "end_conversation",
+        "End the conversation, but only if it seems appropriate and the user does not have any left questions",
+    )
+    def end_conversation(self, state: ManagerState) -> str:
+        state.kill()
+        return "Conversation has been ended. Say goodbye to the user!"
+
+    @tool(
+        "get_events",
+        "Get information about events in the specified time slot. time_from and time_till have to be in isoformat. max_results limits how many events are returned.",
+        read_only = True,
+        failure = "Events could not be found",
+    )
+    def tool_get_events(self, time_from: str, time_till: str, max_results: int = DEFAULT_MAX_RESULTS) -> str:
+        return format_events(self.get_events(time_from = time_from, time_till = time_till, max_results = max_results))
+
+    @tool(
+        "put_event",
+        "Add an event with the requested information to the calendar. time_from and time_till have to be in iCalendar (ICS) format (YYYYMMDDTHHMMSSZ).",
+        failure = "The event could not be created",
+    )
+    def tool_put_event(self, summary: str, time_from: str, time_till: str, description: str | None = None) -> str:
+        self.put_event(summary = summary, time_from = time_from, time_till = time_till, description = description)
+        return "The event was created successfully."
+
+    @tool(
+        "put_events",
+        "Add several events to the calendar at once. Use this instead of calling put_event several times. Every event needs summary, time_from and time_till in iCalendar (ICS) format (YYYYMMDDTHHMMSSZ) and can have a description.",
+        failure = "The events could not be created",
+        parameters = {"events": {"type": "array", "items": EVENT_SCHEMA}},
+    )
+    def tool_put_events(self, events: list[dict]) -> str:
+        return format_batch_results("Created", self.put_events(events))
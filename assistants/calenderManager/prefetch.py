@@ -0,0 +1,144 @@
+import datetime
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+from assistants.calenderManager.eventCache import parse_time
+from assistants.calenderManager.freeBusy import event_interval
+from assistants.tracing import get_tracer
+from assistants.requestScheduler import request_priority, PriorityBoost, BACKGROUND
+
+
+ISO_DATE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+DOTTED_DATE = re.compile(r"\b(\d{1,2})\.(\d{1,2})\.(\d{4})?")
+# words for days relative to today, in the languages the users write in
+RELATIVE_DAYS = [
+    (re.compile(r"\b(today|tonight|this week|heute|diese woche)\b", re.IGNORECASE), 0),
+    (re.compile(r"\b(tomorrow|morgen)\b", re.IGNORECASE), 1),
+    (re.compile(r"\b(day after tomorrow|übermorgen)\b", re.IGNORECASE), 2),
+    (re.compile(r"\b(next week|nächste woche|naechste woche)\b", re.IGNORECASE), 7),
+]
+
+
+def mentioned_days(text: str, today: datetime.date) -> list[datetime.date]:
+    days = []
+    for (pattern, offset) in RELATIVE_DAYS:
+        if pattern.search(text):
+            days.append(today + datetime.timedelta(days = offset))
+    for match in ISO_DATE.finditer(text):
+        try:
+            days.append(datetime.date(int(match.group(1)), int(match.group(2)), int(match.group(3))))
+        except ValueError:
+            pass
+    for match in DOTTED_DATE.finditer(text):
+        year = int(match.group(3)) if match.group(3) else today.year
+        try:
+            days.append(datetime.date(year, int(match.group(2)), int(match.group(1))))
+        except ValueError:
+            pass
+    return list(dict.fromkeys(days))
+
+
+def prefetch_window(day: datetime.date) -> tuple[datetime.datetime, datetime.datetime]:
+    # the week of the day and the one after, so "today", "this week" and "the next days" all fall inside,
+    # one day more on both sides makes up for the time zone the model writes its times in
+    monday = day - datetime.timedelta(days = day.weekday())
+    start = datetime.datetime.combine(monday - datetime.timedelta(days = 1), datetime.time(), tzinfo = datetime.timezone.utc)
+    return start, start + datetime.timedelta(days = 16)
+
+
+class PrefetchCache():
+
+    # Holds reads that were started before the model asked for them. A read whose time range lies inside
+    # a prefetched window is answered from it, and waits for it if the prefetch is still running.
+    # A prefetch that has not started yet is dropped instead, one that has is moved to the interactive lane.
+    # The windows are only kept for a short time and are dropped whenever the calendar is changed.
+
+    def __init__(self, name: str, ttl: float = 30.0, max_workers: int = 2):
+        self.name = name
+        self.ttl = ttl
+        self.executor = ThreadPoolExecutor(max_workers = max_workers)
+
+        self.lock = threading.Lock()
+        # (start, end, future, started at, boost)
+        self.windows: list[tuple[datetime.datetime, datetime.datetime, Future, float, PriorityBoost]] = []
+
+        # prefetches started and reads that were or were not answered from one
+        self.started: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def drop_expired(self):
+        now = time.monotonic()
+        self.windows = [window for window in self.windows if now - window[3] < self.ttl]
+
+    def covering(self, start: datetime.datetime, end: datetime.datetime) -> tuple | None:
+        for window in reversed(self.windows):
+            if window[0] <= start and end <= window[1]:
+                return window
+        return None
+
+    def fill(self, start: datetime.datetime, end: datetime.datetime, function: Callable[..., list | None], *args):
+        with self.lock:
+            self.drop_expired()
+            if self.covering(start, end) is not None:
+                return
+            boost = PriorityBoost()
+            future = self.executor.submit(self.run_in_background, boost, function, *args)
+            self.windows.append((start, end, future, time.monotonic(), boost))
+            self.started += 1
+
+    def run_in_background(self, boost: PriorityBoost, function: Callable[..., list | None], *args) -> list | None:
+        # the reads of a user who is waiting go to the server first, until someone waits for this one
+        with request_priority(BACKGROUND, boost):
+            return function(*args)
+
+    def lookup(self, time_from, time_till, max_results: int | None) -> list | None:
+        try:
+            start, end = parse_time(time_from), parse_time(time_till)
+        except (ValueError, TypeError, AttributeError):
+            return None
+
+        with self.lock:
+            self.drop_expired()
+            window = self.covering(start, end)
+            future = None
+            if window is not None:
+                future = window[2]
+                if future.cancel():
+                    # still queued behind other prefetches, the caller's own read is sent right away instead
+                    self.windows.remove(window)
+                    future = None
+        events = None
+        if future is not None:
+            # the requests of the prefetch must not wait behind bulk work while the user waits for them
+            window[4].raise_priority()
+            try:
+                events = future.result()
+            except Exception:
+                # the read is tried again the normal way
+                events = None
+
+        with self.lock:
+            if events is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        get_tracer().count_prefetch(self.name, events is not None)
+        if events is None:
+            return None
+
+        # the window is wider than the question, only what overlaps the asked range is returned
+        selected = []
+        for event in events:
+            interval = event_interval(event)
+            if interval is not None and interval[0] < end and interval[1] > start:
+                selected.append(event)
+                if max_results is not None and len(selected) >= max_results:
+                    break
+        return selected
+
+    def clear(self):
+        with self.lock:
+            self.windows = []
@@ -0,0 +1,74 @@
+import datetime
+import json
+
+
+# every event that goes back to the model has exactly these fields, for both calendars
+EVENT_FIELDS = ("id", "calendar", "summary", "start", "end", "color", "description")
+
+DESCRIPTION_LIMIT = 80
+EVENT_LIMIT = 15
+
+
+def format_time(value) -> str | None:
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        # google keeps the time in dateTime and all-day events in date
+        value = value.get("dateTime", value.get("date"))
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def shorten(text: str | None, limit: int = DESCRIPTION_LIMIT) -> str | None:
+    if not text:
+        return None
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def compact_event(event: dict) -> dict:
+    # accepts google event resources as well as the records of the nextcloud calendar
+    compact = {
+        "id": event.get("id", event.get("uid")),
+        # only set on results that combine several calendars
+        "calendar": event.get("calendar"),
+        "summary": event.get("summary"),
+        "start": format_time(event.get("start")),
+        "end": format_time(event.get("end")),
+        "color": event.get("colorId", event.get("color")),
+        "description": shorten(event.get("description")),
+    }
+    # fields without a value are left out instead of being sent as null
+    return {field: compact[field] for field in EVENT_FIELDS if compact[field] is not None}
+
+
+def format_event(event: dict) -> str:
+    return json.dumps(compact_event(event), ensure_ascii = False, separators = (",", ":"))
+
+
+def format_events(events: list[dict], limit: int = EVENT_LIMIT) -> str:
+    if len(events) == 0:
+        return "No events found."
+
+    compact_events = [compact_event(event) for event in events[:limit]]
+    text = "\n".join(json.dumps(event, ensure_ascii = False, separators = (",", ":")) for event in compact_events)
+    if len(events) > limit:
+        # the rest is only summarized, the model can ask for a narrower time range
+        last_start = format_time(events[-1].get("start"))
+        text += f"\n... and {len(events) - limit} more events until {last_start}. Ask for a shorter time range to see them."
+    return f"{len(events)} events:\n{text}"
+
+
+def format_batch_results(action: str, results: list[dict]) -> str:
+    # one line per item, so the model can tell the user exactly which changes failed
+    succeeded = sum(1 for result in results if result["ok"])
+    lines = [f"{action} {succeeded} of {len(results)} events."]
+    for (index, result) in enumerate(results):
+        if not result["ok"]:
+            lines.append(f"{index}: failed because of {shorten(result['error'], 160)}")
+        elif isinstance(result.get("event"), dict):
+            lines.append(f"{index}: ok {format_event(result['event'])}")
+        else:
+            lines.append(f"{index}: ok")
+    return "\n".join(lines)
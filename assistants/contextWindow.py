@@ -0,0 +1,116 @@
+from typing import Callable
+
+
+# put after a recent tool result that had to be cut so the window fits
+SHORTENED_NOTE = " ... [tool result shortened to fit the context window]"
+
+
+def estimate_tokens(text: str) -> int:
+    # roughly four characters per token for english text and JSON
+    return len(text) // 4 + 1
+
+
+class ContextWindow():
+
+    def __init__(
+        self,
+        token_budget: int = 4096,
+        keep_recent: int = 6,
+        tool_result_limit: int = 400,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+    ):
+        # maximum number of tokens the messages may take up in a request
+        self.token_budget = token_budget
+        # number of most recent messages that are never shortened or dropped
+        self.keep_recent = keep_recent
+        # number of characters an old tool result is cut down to
+        self.tool_result_limit = tool_result_limit
+        self.count_tokens = count_tokens
+
+        self.messages: list[dict[str,str]] = []
+        self.token_counts: list[int] = []
+        self.is_tool_result: list[bool] = []
+        self.total_tokens: int = 0
+
+    def reset(self, messages: list[dict[str,str]]):
+        self.messages = []
+        self.token_counts = []
+        self.is_tool_result = []
+        self.total_tokens = 0
+        for message in messages:
+            self.append(message)
+
+    def append(self, message: dict[str,str], is_tool_result: bool = False):
+        # every message costs a few tokens for its role and separators on top of its content
+        token_count = self.count_tokens(message["content"]) + 4
+        self.messages.append(message)
+        self.token_counts.append(token_count)
+        self.is_tool_result.append(is_tool_result)
+        self.total_tokens += token_count
+        self.compact()
+
+    def first_unpinned(self) -> int:
+        # the system prompt always stays at the front of the window
+        if len(self.messages) > 0 and self.messages[0]["role"] == "system":
+            return 1
+        return 0
+
+    def is_turn_start(self, index: int) -> bool:
+        # a turn begins with a message of the user, tool results are sent as user messages as well
+        return self.messages[index]["role"] == "user" and not self.is_tool_result[index]
+
+    def replace(self, index: int, content: str):
+        message = {"role": self.messages[index]["role"], "content": content}
+        token_count = self.count_tokens(content) + 4
+        self.total_tokens += token_count - self.token_counts[index]
+        self.messages[index] = message
+        self.token_counts[index] = token_count
+
+    def remove(self, index: int):
+        self.total_tokens -= self.token_counts[index]
+        del self.messages[index]
+        del self.token_counts[index]
+        del self.is_tool_result[index]
+
+    def compact(self):
+        if self.total_tokens <= self.token_budget:
+            return
+
+        start = self.first_unpinned()
+        # the protected messages begin with the question of their oldest turn,
+        # so a tool call and its result are never kept without the request that caused them
+        recent = max(start, len(self.messages) - self.keep_recent)
+        protected = next((index for index in range(recent, start - 1, -1) if self.is_turn_start(index)), start)
+
+        # first shorten old tool results, they are the largest and least useful messages
+        for index in range(start, protected):
+            if self.total_tokens <= self.token_budget:
+                return
+            content = self.messages[index]["content"]
+            if self.is_tool_result[index] and len(content) > self.tool_result_limit:
+                self.replace(index, content[:self.tool_result_limit] + " ... [older tool result shortened]")
+
+        # then drop the oldest turns as a whole, from a question up to the next one, until the window fits again
+        while self.total_tokens > self.token_budget and start < protected:
+            turn_end = next((index for index in range(start + 1, protected) if self.is_turn_start(index)), protected)
+            for _ in range(start, turn_end):
+                self.remove(start)
+            protected -= turn_end - start
+
+        # a conversation should not continue with an answer or a tool result right after the system prompt
+        while start < protected and not self.is_turn_start(start):
+            self.remove(start)
+            protected -= 1
+
+        # the recent messages alone can be over the budget when a tool returned a lot, then their tool results
+        # are cut down as well, each only as far as needed but not below tool_result_limit
+        for index in range(protected, len(self.messages)):
+            if self.total_tokens <= self.token_budget:
+                return
+            content = self.messages[index]["content"]
+            keep = len(content)
+            while self.is_tool_result[index] and self.total_tokens > self.token_budget and keep > self.tool_result_limit:
+                excess = self.total_tokens - self.token_budget
+                # the characters are assumed to cost the same on average, a second round takes off what is left over
+                keep = max(self.tool_result_limit, min(keep - 1, int(keep * (1 - excess / self.token_counts[index])) - len(SHORTENED_NOTE)))
+                self.replace(index, content[:keep] + SHORTENED_NOTE)
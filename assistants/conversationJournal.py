@@ -0,0 +1,229 @@
+import atexit
+import gzip
+import json
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+from assistants.dialogueSession import DialogueSession
+
+
+SEGMENT_PATTERN = re.compile(r"journal-(\d{6})\.jsonl(\.gz)?$")
+
+
+class ConversationJournal():
+
+    # Append-only JSON-lines log of every turn. A session starts with a snapshot in each segment and
+    # continues with the changes of every turn, so restoring it only reads one segment from the last
+    # snapshot on. Closed segments are compressed, the index of the open one is rebuilt on start.
+
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int = 16 * 1024 * 1024,
+        buffer_size: int = 64 * 1024,
+        flush_interval: float = 1.0,
+        snapshot_every: int = 20,
+    ):
+        self.directory = directory
+        os.makedirs(directory, exist_ok = True)
+        # a full segment is closed and compressed, a new one is started
+        self.segment_size = segment_size
+        # records are collected in memory until this many bytes are waiting or the interval is over
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        # a new snapshot after this many turns keeps the replay of a session short
+        self.snapshot_every = snapshot_every
+
+        self.lock = threading.RLock()
+        self.buffer: list[bytes] = []
+        self.buffered_bytes: int = 0
+        self.last_flush: float = time.monotonic()
+
+        # session id -> (segment, [(offset, length), ...]) from the last snapshot on
+        self.index: dict[str, tuple[int, list[tuple[int, int]]]] = {}
+        self.load_index()
+
+        segments = self.segments()
+        self.segment: int = max(segments, default = 1)
+        if os.path.exists(self.segment_path(self.segment, compressed = True)):
+            # the last segment was closed already, new records go to a fresh one
+            self.segment += 1
+        for segment in segments:
+            if segment < self.segment and os.path.exists(self.segment_path(segment)) and not os.path.exists(self.segment_path(segment, compressed = True)):
+                # closed before it could be compressed
+                threading.Thread(target = self.compress, args = (segment,), daemon = True).start()
+
+        # the saved index may be behind the open segment, so its part is read again
+        self.index = {session_id: entry for (session_id, entry) in self.index.items() if entry[0] != self.segment}
+        self.rebuild_index(self.segment)
+        self.file = open(self.segment_path(self.segment), "ab")
+        self.position: int = self.file.tell()
+
+        # writes what is buffered also when no further turn comes
+        threading.Thread(target = self.flush_periodically, daemon = True).start()
+        atexit.register(self.close)
+
+    def segment_path(self, segment: int, compressed: bool = False) -> str:
+        return os.path.join(self.directory, f"journal-{segment:06d}.jsonl" + (".gz" if compressed else ""))
+
+    def index_path(self) -> str:
+        return os.path.join(self.directory, "journal-index.json")
+
+    def segments(self) -> list[int]:
+        return sorted({int(match.group(1)) for match in map(SEGMENT_PATTERN.match, os.listdir(self.directory)) if match})
+
+    def load_index(self):
+        # the index of the closed segments is written whenever a segment is closed
+        if not os.path.exists(self.index_path()):
+            for segment in self.segments():
+                self.rebuild_index(segment)
+            return
+        with open(self.index_path()) as file:
+            self.index = {
+                session_id: (segment, [tuple(location) for location in locations])
+                for (session_id, (segment, locations)) in json.load(file).items()
+            }
+
+    def save_index(self):
+        path = self.index_path()
+        with open(path + ".tmp", "w") as file:
+            json.dump(self.index, file)
+        os.replace(path + ".tmp", path)
+
+    def rebuild_index(self, segment: int):
+        # reads a segment once and notes where the records of every session are
+        data = self.read_segment(segment)
+        if data is None:
+            return
+        offset = 0
+        for line in data.splitlines(keepends = True):
+            if not line.endswith(b"\n"):
+                # the last line of a crash is incomplete and is left out
+                break
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                offset += len(line)
+                continue
+            self.note(record, segment, offset, len(line))
+            offset += len(line)
+
+    def note(self, record: dict, segment: int, offset: int, length: int):
+        session_id = record["session"]
+        if record.get("ended"):
+            self.index.pop(session_id, None)
+        elif "snapshot" in record:
+            self.index[session_id] = (segment, [(offset, length)])
+        elif session_id in self.index and self.index[session_id][0] == segment:
+            self.index[session_id][1].append((offset, length))
+
+    def read_segment(self, segment: int) -> bytes | None:
+        path = self.segment_path(segment)
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                return file.read()
+        if os.path.exists(self.segment_path(segment, compressed = True)):
+            with gzip.open(self.segment_path(segment, compressed = True), "rb") as file:
+                return file.read()
+        return None
+
+    def record_turn(self, session: DialogueSession):
+        with self.lock:
+            if self.position >= self.segment_size:
+                self.rotate()
+            entry = self.index.get(session.session_id)
+            if entry is None or entry[0] != self.segment or len(entry[1]) >= self.snapshot_every:
+                session.clear_journal_delta()
+                record = {"session": session.session_id, "time": time.time(), "snapshot": session.to_dict()}
+            else:
+                record = {"session": session.session_id, "time": time.time(), "delta": session.take_journal_delta()}
+            self.append(record)
+
+    def record_end(self, session_id: str):
+        with self.lock:
+            if session_id in self.index:
+                self.append({"session": session_id, "time": time.time(), "ended": True})
+
+    def append(self, record: dict):
+        line = (json.dumps(record, ensure_ascii = False, separators = (",", ":")) + "\n").encode("utf-8")
+        self.note(record, self.segment, self.position, len(line))
+        self.buffer.append(line)
+        self.buffered_bytes += len(line)
+        self.position += len(line)
+        if self.buffered_bytes >= self.buffer_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.buffer:
+                self.file.write(b"".join(self.buffer))
+                self.file.flush()
+                self.buffer = []
+                self.buffered_bytes = 0
+            self.last_flush = time.monotonic()
+
+    def flush_periodically(self):
+        while not self.file.closed:
+            time.sleep(self.flush_interval)
+            with self.lock:
+                if not self.file.closed:
+                    self.flush()
+
+    def rotate(self):
+        self.flush()
+        self.file.close()
+        closed = self.segment
+        self.segment += 1
+        self.file = open(self.segment_path(self.segment), "ab")
+        self.position = 0
+        # sessions that keep talking write a new snapshot into the new segment
+        self.save_index()
+        threading.Thread(target = self.compress, args = (closed,), daemon = True).start()
+
+    def compress(self, segment: int):
+        path = self.segment_path(segment)
+        compressed_path = self.segment_path(segment, compressed = True)
+        with open(path, "rb") as source, gzip.open(compressed_path + ".tmp", "wb") as target:
+            shutil.copyfileobj(source, target)
+        os.replace(compressed_path + ".tmp", compressed_path)
+        with self.lock:
+            os.remove(path)
+
+    def read_records(self, segment: int, locations: list[tuple[int, int]]) -> list[dict]:
+        path = self.segment_path(segment)
+        with self.lock:
+            if os.path.exists(path):
+                if segment == self.segment:
+                    self.flush()
+                # only the lines of this session are touched, not the whole segment
+                with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+                    return [json.loads(data[offset:offset + length]) for (offset, length) in locations]
+        data = self.read_segment(segment)
+        return [json.loads(data[offset:offset + length]) for (offset, length) in locations]
+
+    def restore(self, session_id: str) -> DialogueSession | None:
+        with self.lock:
+            entry = self.index.get(session_id)
+            if entry is None:
+                return None
+            segment, locations = entry[0], list(entry[1])
+        try:
+            records = self.read_records(segment, locations)
+            session = DialogueSession.from_dict(records[0]["snapshot"])
+            for record in records[1:]:
+                session.apply_journal_delta(record["delta"])
+            return session
+        except Exception as error:
+            print(f"Session {session_id} could not be replayed from the journal: {error}")
+            return None
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.flush()
+            self.file.close()
+            self.save_index()
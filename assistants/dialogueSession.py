@@ -0,0 +1,86 @@
+from collections import deque
+from assistants.managerStructure import ManagerStructure, ManagerState
+
+# the assistant answers a session keeps in memory, older ones are only in the journal
+HISTORY_LIMIT = 50
+
+
+class DialogueSession():
+
+    # the whole state of one conversation, the managers and backends it talks to are shared
+    __slots__ = ("session_id", "active_manager", "routed_to", "manager_states", "history", "unjournaled_history")
+
+    def __init__(self, session_id: str):
+
+        self.session_id = session_id
+
+        # name of the manager the user is currently talking to
+        self.active_manager: str = "Manager"
+        # backend the last calendar request went to, later requests without a backend name stick to it
+        self.routed_to: str | None = None
+        self.manager_states: dict[str, ManagerState] = {}
+        self.history: deque[dict[str,str]] = deque(maxlen = HISTORY_LIMIT)
+        # history entries added since the last journal record
+        self.unjournaled_history: list[dict[str,str]] = []
+
+    def get_state(self, name: str, manager: ManagerStructure) -> ManagerState:
+        if name not in self.manager_states:
+            self.manager_states[name] = manager.new_state()
+        return self.manager_states[name]
+
+    def add_history(self, message: dict[str,str]):
+        self.history.append(message)
+        self.unjournaled_history.append(message)
+
+    @property
+    def is_alive(self) -> bool:
+        return all(state.is_alive for state in self.manager_states.values())
+
+    def estimate_size(self) -> int:
+        size = sum(state.estimate_size() for state in self.manager_states.values())
+        size += sum(len(message["content"]) + 64 for message in self.history)
+        return size + 200
+
+    def take_journal_delta(self) -> dict:
+        # everything that changed since the last call, replayed by apply_journal_delta
+        delta = {
+            "active_manager": self.active_manager,
+            "routed_to": self.routed_to,
+            "history": self.unjournaled_history,
+            "manager_states": {name: state.take_journal_delta() for (name, state) in self.manager_states.items()},
+        }
+        self.unjournaled_history = []
+        return delta
+
+    def apply_journal_delta(self, delta: dict):
+        self.active_manager = delta["active_manager"]
+        self.routed_to = delta["routed_to"]
+        self.history.extend(delta["history"])
+        for (name, state_delta) in delta["manager_states"].items():
+            if name not in self.manager_states:
+                self.manager_states[name] = ManagerState()
+            self.manager_states[name].apply_journal_delta(state_delta)
+
+    def clear_journal_delta(self):
+        # after a snapshot, the changes before it do not have to be written again
+        self.unjournaled_history = []
+        for state in self.manager_states.values():
+            state.take_journal_delta()
+
+    def to_dict(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "active_manager": self.active_manager,
+            "routed_to": self.routed_to,
+            "manager_states": {name: state.to_dict() for (name, state) in self.manager_states.items()},
+            "history": list(self.history),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DialogueSession":
+        session = cls(data["session_id"])
+        session.active_manager = data["active_manager"]
+        session.routed_to = data.get("routed_to")
+        session.manager_states = {name: ManagerState.from_dict(state) for (name, state) in data["manager_states"].items()}
+        session.history.extend(data["history"])
+        return session
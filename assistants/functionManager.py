@@ -1,60 +1,99 @@
-from assistants.managerStructure import ManagerStructure
+from assistants.managerStructure import ManagerStructure, ManagerState
+from assistants.backendRegistry import BackendRegistry
+from assistants.calenderManager.eventCache import parse_time
+from assistants.calenderManager.freeBusy import event_time
+from assistants.calenderManager.resultShaping import compact_event, format_events
+from assistants.toolRegistry import tool
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Literal
+import contextvars
+import datetime
+import heapq
+
+
+DEFAULT_MAX_RESULTS = 100
+
+# events without a readable start are put at the end
+LAST = datetime.datetime.max.replace(tzinfo = datetime.timezone.utc)
+
+
+def start_key(event: dict) -> datetime.datetime:
+    try:
+        return parse_time(event_time(event["start"]))
+    except (ValueError, TypeError, AttributeError, KeyError):
+        return LAST
 
 
 class FunctionManager(ManagerStructure):
 
-    def __init__(self):
-        
+    def __init__(self, backends: BackendRegistry | None = None, backend_timeout: float = 5.0, max_workers: int = 4):
+
         super().__init__()
         self.prompt: str = self.define_prompt()
-        self.tools: list = self.append_tools()
-        self.messages: list[dict[str,str]] = [{
-            "role": "system",
-            "content": self.prompt
-        }]
-
-    def handle_function_call(self, called_function: str, arguments: dict) -> str:
-        if called_function == "end_conversation":
-            self.kill()
-            return "Conversation has been ended. Say goodbye to the user!"
-        elif called_function == "assign_task_to":
-            self.assigned_task_to = arguments["target"]
-            return ""
-        else:
-            return "This function does not exist!"
-
-
-    def append_tools(self):
-        all_tools = self.tools
-        tools = [
-            self.define_function_assign_task_to(),
-        ]
-        for tool in tools:
-            all_tools.append(tool)
-        return all_tools
+
+        # the calendars get_all_events reads, the same registry the assistant hands tasks to
+        self.backends: BackendRegistry | None = backends
+        # seconds every calendar has to answer, a slower one is reported as missing instead of holding up the answer
+        self.backend_timeout: float = backend_timeout
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers = max_workers)
 
     def get_tools(self) -> list[str]:
         return self.tools
-    
+
     def define_prompt(self):
         file = open("assistants/functionManagerPrompt.txt", "r")
         prompt = file.read()
         return prompt
 
-    def define_function_assign_task_to(self):
-        function = {
-            "type": "function",
-            "function": {
-                "name": "assign_task_to",
-                "description": "Assign the task to the assistant who manages the topic that matches the user request.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "target": {"type": ["Google", "Nextcloud"]}
-                    },
-                    "required": ["target"],
-                }
-            }
+    @tool("assign_task_to", "Assign the task to the assistant who manages the topic that matches the user request.")
+    def assign_task_to(self, target: Literal["Google", "Nextcloud"], state: ManagerState) -> str:
+        state.assigned_task_to = target
+        return ""
+
+    def load_calendar(self, name: str, time_from: str, time_till: str, max_results: int) -> list[dict]:
+        events = self.backends.get(name).get_events(time_from, time_till, max_results = max_results)
+        if events is None:
+            raise RuntimeError("the events could not be loaded")
+        # every calendar is sorted on its own already, sorting again only makes sure of it for the merge
+        return sorted((dict(compact_event(event), calendar = name) for event in events), key = start_key)
+
+    @tool(
+        "get_all_events",
+        "Get the events of all calendars (Google and Nextcloud) in the specified time slot, sorted by start. Use this when the user wants to know what is on their schedule without naming a calendar. time_from and time_till have to be in isoformat.",
+        read_only = True,
+        failure = "The events could not be loaded",
+    )
+    def get_all_events(self, time_from: str, time_till: str, max_results: int = DEFAULT_MAX_RESULTS) -> str:
+        if self.backends is None:
+            raise RuntimeError("no calendars are connected")
+
+        # a calendar that needs a login is not started here, that would open the browser from a worker thread,
+        # it is left to the assistant the task is assigned to
+        names = [name for name in self.backends.names() if self.backends.can_start_unattended(name)]
+        missing = [
+            f"The {name} calendar is not connected yet, its events are missing. Assign the task to {name} to read it."
+            for name in self.backends.names() if name not in names
+        ]
+
+        # all calendars are asked at the same time, the tracing context goes along to every thread
+        futures = {
+            name: self.executor.submit(contextvars.copy_context().run, self.load_calendar, name, time_from, time_till, max_results)
+            for name in names
         }
-        return function
\ No newline at end of file
+        wait(futures.values(), timeout = self.backend_timeout)
+
+        results = []
+        for (name, future) in futures.items():
+            if not future.done():
+                # the request keeps running in the background, the next call may find the calendar ready
+                missing.append(f"The {name} calendar did not answer in time, its events are missing.")
+            elif future.exception() is not None:
+                missing.append(f"The {name} calendar failed because of {future.exception()}, its events are missing.")
+            else:
+                results.append(future.result())
+
+        if len(results) == 0:
+            # not a failure of the tool, the model tells the user which calendars could not be read
+            return " ".join(["No calendar could be read.", *missing])
+        events = list(heapq.merge(*results, key = start_key))[:max_results]
+        return "\n".join([format_events(events), *missing])
@@ -0,0 +1,41 @@
+import threading
+import time
+from typing import Callable
+
+
+class KeepAlive():
+
+    # Calls ping every interval seconds on a background thread, so an idle connection is neither closed
+    # by the server nor found dead by the next user turn. A failed ping is reported and tried again.
+
+    def __init__(self, name: str, ping: Callable[[], None], interval: float = 30.0):
+        self.name = name
+        self.ping = ping
+        self.interval = interval
+
+        self.stopped = threading.Event()
+        self.thread: threading.Thread | None = None
+        # whether the last ping got through and when it was sent
+        self.alive: bool = True
+        self.last_ping: float | None = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target = self.ping_periodically, daemon = True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def ping_periodically(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.ping()
+                if not self.alive:
+                    print(f"{self.name} is reachable again")
+                self.alive = True
+            except Exception as error:
+                if self.alive:
+                    print(f"{self.name} did not answer the keep-alive ping: {error}")
+                self.alive = False
+            self.last_ping = time.monotonic()
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import requests
+import httpx
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class LLMClient():
+
+    def __init__(
+        self,
+        model_URL: str,
+        pool_size: int = 10,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 120.0,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+    ):
+        self.model_URL = model_URL
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.headers = {"accept": "application/json", "Content-Type": "application/json"}
+
+        # one long-lived session so that every turn reuses the same keep-alive connections
+        retry = Retry(
+            total = max_retries,
+            backoff_factor = backoff_factor,
+            status_forcelist = [502, 503, 504],
+            allowed_methods = ["POST"],
+        )
+        adapter = HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size, max_retries = retry)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # the async client is created lazily, because it is bound to the event loop it is first used in
+        self.async_client: httpx.AsyncClient | None = None
+
+    def get_async_client(self) -> httpx.AsyncClient:
+        if self.async_client is None or self.async_client.is_closed:
+            self.async_client = httpx.AsyncClient(
+                headers = self.headers,
+                timeout = httpx.Timeout(self.timeout[1], connect = self.timeout[0]),
+                limits = httpx.Limits(max_connections = self.pool_size, max_keepalive_connections = self.pool_size),
+                transport = httpx.AsyncHTTPTransport(retries = self.max_retries),
+            )
+        return self.async_client
+
+    def get_response(self, messages, tools) -> str:
+        response = self.session.post(
+            url = self.model_URL,
+            json = {"messages": messages, "tools": tools},
+            timeout = self.timeout,
+        )
+        return response.json()["response"]["content"]
+
+    def stream_response(self, messages, tools):
+        # the model server sends one JSON object per line, each holding the next piece of the completion
+        with self.session.post(
+            url = self.model_URL,
+            json = {"messages": messages, "tools": tools, "stream": True},
+            timeout = self.timeout,
+            stream = True,
+        ) as response:
+            for line in response.iter_lines(decode_unicode = True):
+                if not line:
+                    continue
+                if line.startswith("data:"):
+                    line = line[len("data:"):].strip()
+                    if line == "[DONE]":
+                        break
+                chunk = json.loads(line)
+                delta = chunk["response"]["content"]
+                if delta:
+                    yield delta
+                if chunk.get("done"):
+                    break
+
+    async def get_response_async(self, messages, tools) -> str:
+        client = self.get_async_client()
+        for attempt in range(self.max_retries + 1):
+            response = await client.post(self.model_URL, json = {"messages": messages, "tools": tools})
+            if response.status_code not in (502, 503, 504) or attempt == self.max_retries:
+                break
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+        return response.json()["response"]["content"]
+
+    def close(self):
+        self.session.close()
+
+    async def close_async(self):
+        if self.async_client is not None:
+            await self.async_client.aclose()
@@ -1,12 +1,16 @@
+from assistants.contextWindow import ContextWindow
+from assistants.toolRegistry import ToolSpec, tool, collect_tools
 
 
-class ManagerStructure():
+class ManagerState():
 
-    def __init__(self):
-        
-        self.prompt: str = ""
-        self.tools: list = [self.define_function_end_conversation()]
-        self.messages: list[dict[str,str]] = []
+    # everything a manager remembers about one conversation, the manager itself stays stateless
+    __slots__ = ("context", "is_statisfied", "assigned_task_to", "is_alive", "journal_entries")
+
+    def __init__(self, token_budget: int = 4096):
+
+        # keeps the messages within the token budget of the model
+        self.context: ContextWindow = ContextWindow(token_budget = token_budget)
 
         # whether the assistant is ready to return an anwser to the user or not
         self.is_statisfied: bool = False
@@ -16,9 +20,21 @@ class ManagerStructure():
 
         self.is_alive: bool = True
 
+        # message changes since the last journal record, as [kind, message(s), is_tool_result]
+        self.journal_entries: list[list] = []
 
-    def handle_function_call(self, called_function: str, arguments: dict) -> str:
-        pass
+    @property
+    def messages(self) -> list[dict[str,str]]:
+        return self.context.messages
+
+    @messages.setter
+    def messages(self, messages: list[dict[str,str]]):
+        self.context.reset(messages)
+        self.journal_entries.append(["reset", list(messages), False])
+
+    def append_message(self, message: dict[str,str], is_tool_result: bool = False):
+        self.context.append(message, is_tool_result = is_tool_result)
+        self.journal_entries.append(["append", message, is_tool_result])
 
     def statisfy(self):
         self.is_statisfied = True
@@ -30,29 +46,128 @@ class ManagerStructure():
         self.is_alive = False
 
     def push_user_message(self, message: str):
-        self.messages.append({
+        self.append_message({
             "role": "user",
             "content": message
         })
+
+    def push_function_response(self, message: str):
+        self.append_message({
+            "role": "user",
+            "content": message
+        }, is_tool_result = True)
     
     def push_assistant_message(self, message: str):
-        self.messages.append({
+        self.append_message({
             "role": "assistant",
             "content": message
         })
 
-    def define_function_end_conversation(self) -> dict:
-        function = {
-            "type": "function",
-            "function": {
-                "name": "end_conversation",
-                "description": "Call this function to end the conversation, but ONLY when the user is done with his requests and the user does not have any left questions. Before calling this function ask the user at least once if they have any left questions.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                    },
-                    "required": [],
-                }
-            }
+    def estimate_size(self) -> int:
+        # rough number of bytes the state takes up in memory
+        return 4 * self.context.total_tokens + 64 * len(self.context.messages) + 200
+
+    def take_journal_delta(self) -> dict:
+        entries = self.journal_entries
+        self.journal_entries = []
+        return {
+            "entries": entries,
+            "is_statisfied": self.is_statisfied,
+            "assigned_task_to": self.assigned_task_to,
+            "is_alive": self.is_alive,
+        }
+
+    def apply_journal_delta(self, delta: dict):
+        # replays the changes on the context window, which compacts them the same way it did the first time
+        for (kind, value, is_tool_result) in delta["entries"]:
+            if kind == "reset":
+                self.context.reset(value)
+            else:
+                self.context.append(value, is_tool_result = is_tool_result)
+        self.is_statisfied = delta["is_statisfied"]
+        self.assigned_task_to = delta["assigned_task_to"]
+        self.is_alive = delta["is_alive"]
+
+    def to_dict(self) -> dict:
+        return {
+            "messages": self.context.messages,
+            "is_tool_result": self.context.is_tool_result,
+            "is_statisfied": self.is_statisfied,
+            "assigned_task_to": self.assigned_task_to,
+            "is_alive": self.is_alive,
         }
-        return function
\ No newline at end of file
+
+    @classmethod
+    def from_dict(cls, data: dict, token_budget: int = 4096) -> "ManagerState":
+        state = cls(token_budget = token_budget)
+        for (message, is_tool_result) in zip(data["messages"], data["is_tool_result"]):
+            state.context.append(message, is_tool_result = is_tool_result)
+        state.is_statisfied = data["is_statisfied"]
+        state.assigned_task_to = data["assigned_task_to"]
+        state.is_alive = data["is_alive"]
+        return state
+
+
+class ManagerStructure():
+
+    # filled for every subclass when it is created, shared by all of its instances
+    tool_specs: dict[str, ToolSpec] = {}
+    tool_schemas: list[dict] = []
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.tool_specs = collect_tools(cls)
+        cls.tool_schemas = [spec.schema for spec in cls.tool_specs.values()]
+
+    def __init__(self, token_budget: int = 4096):
+        
+        self.prompt: str = ""
+        self.tools: list = self.tool_schemas
+        self.token_budget: int = token_budget
+
+        # tools without side effects, several calls to them can run at the same time
+        self.read_only_tools: set[str] = {spec.name for spec in self.tool_specs.values() if spec.read_only}
+
+    def new_state(self) -> ManagerState:
+        state = ManagerState(token_budget = self.token_budget)
+        if self.prompt:
+            state.messages = [{
+                "role": "system",
+                "content": self.prompt
+            }]
+        return state
+
+    def handle_function_call(self, called_function: str, arguments: dict, state: ManagerState) -> str:
+
+        spec = self.tool_specs.get(called_function)
+        if spec is None:
+            return f"The function {called_function} does not exist. DO NOT try again!"
+
+        # bad arguments are sent back before anything reaches a calendar
+        try:
+            arguments = spec.validate(arguments if arguments is not None else {}, "")
+        except ValueError as error:
+            return f"The function {called_function} was called with invalid arguments: {error}. Call it again with correct arguments."
+
+        if spec.takes_state:
+            arguments["state"] = state
+        try:
+            return spec.function(self, **arguments)
+        except Exception as error:
+            return f"{spec.failure} because of {error}. Excuse yourself in front of the user."
+        finally:
+            if not spec.read_only:
+                # also after a failure, part of a bulk change may have gone through
+                self.invalidate_reads()
+
+    def invalidate_reads(self):
+        # called after every tool that may change something, managers that keep reads around drop them here
+        pass
+
+    @tool(
+        "end_conversation",
+        "Call this function to end the conversation, but ONLY when the user is done with his requests and the user does not have any left questions. Before calling this function ask the user at least once if they have any left questions.",
+    )
+    def end_conversation(self, state: ManagerState) -> str:
+        state.kill()
+        return "Conversation has been ended. Say goodbye to the user!"
@@ -0,0 +1,235 @@
+import contextlib
+import contextvars
+import datetime
+import email.utils
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Any, Callable
+from assistants.tracing import get_tracer
+
+
+# lanes a request waits in, lower ones go first
+INTERACTIVE = 0
+BULK = 1
+# prefetches and keep-alive pings
+BACKGROUND = 2
+
+# statuses that mean the request can be sent again later
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# the ones that mean the server is over quota or overloaded, the whole backend pauses for them,
+# the others are a failure of the single request and only that one waits before it is sent again
+THROTTLE_STATUSES = frozenset({429, 503})
+
+# the lane of the requests sent from the current context, set by the callers that know, e.g. the bulk tools
+current_priority: contextvars.ContextVar[int] = contextvars.ContextVar("current_priority", default = INTERACTIVE)
+# lets the requests sent from the current context be moved to the interactive lane while they wait, see PriorityBoost
+current_boost: contextvars.ContextVar["PriorityBoost | None"] = contextvars.ContextVar("current_boost", default = None)
+
+
+@contextlib.contextmanager
+def request_priority(priority: int, boost: "PriorityBoost | None" = None):
+    token = current_priority.set(priority)
+    boost_token = current_boost.set(boost)
+    try:
+        yield
+    finally:
+        current_boost.reset(boost_token)
+        current_priority.reset(token)
+
+
+class PriorityBoost():
+
+    # Handed to background work, e.g. a prefetch. When a user starts waiting for its result, raise() moves
+    # the requests it has waiting in a scheduler to the interactive lane, so they do not wait behind bulk work.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.raised: bool = False
+        # the schedulers a request of this work is waiting in right now
+        self.conditions: set[threading.Condition] = set()
+
+    def raise_priority(self):
+        with self.lock:
+            self.raised = True
+            conditions = list(self.conditions)
+        for condition in conditions:
+            with condition:
+                condition.notify_all()
+
+    def register(self, condition: threading.Condition):
+        with self.lock:
+            self.conditions.add(condition)
+
+    def unregister(self, condition: threading.Condition):
+        with self.lock:
+            self.conditions.discard(condition)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    # Retry-After holds either seconds or an HTTP date
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (moment - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class RetryLater(Exception):
+
+    # raised by a scheduled function when the server throttled it, the scheduler waits and calls it again,
+    # after the last try the error is raised or the result is returned as the caller would have gotten it
+
+    def __init__(self, delay: float | None = None, error: Exception | None = None, result: Any = None, pause_backend: bool = True):
+        super().__init__(f"throttled, retry after {delay} seconds" if delay is not None else "throttled")
+        # what the server asked for in Retry-After, None leaves the wait to the backoff
+        self.delay = delay
+        self.error = error
+        self.result = result
+        # whether the other requests to the backend wait as well
+        self.pause_backend = pause_backend
+
+
+class RequestScheduler():
+
+    # Sends the requests to one backend: at most `rate` per second on average with bursts of `burst`,
+    # at most max_concurrency at the same time, and the interactive ones before bulk and background work.
+    # When the server throttles, the whole backend pauses for Retry-After or a jittered exponential backoff,
+    # so the waiting requests are not sent into the same limit again. Other failures that can be retried
+    # only hold back the request that failed.
+
+    def __init__(
+        self,
+        name: str,
+        rate: float = 10.0,
+        burst: int = 20,
+        max_concurrency: int = 8,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+    ):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        # also the longest a Retry-After is followed, so no turn waits longer than this for one request
+        self.max_delay = max_delay
+
+        self.condition = threading.Condition()
+        self.tokens: float = float(burst)
+        self.updated: float = time.monotonic()
+        self.running: int = 0
+        # (priority, arrival) of every request that waits, the first one is the next to go
+        self.waiting: list[tuple[int, int]] = []
+        self.sequence = itertools.count()
+        self.paused_until: float = 0.0
+
+        # requests sent, answers that were throttled, requests that were retried on their own and requests that gave up after max_retries
+        self.sent: int = 0
+        self.throttled: int = 0
+        self.retried: int = 0
+        self.failed: int = 0
+
+    def refill(self, now: float):
+        self.tokens = min(float(self.burst), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, priority: int, cost: int, boost: PriorityBoost | None = None):
+        # requests that cost more than a full bucket, e.g. large batches, go once the bucket is full and leave it in debt
+        needed = min(cost, self.burst)
+        if boost is not None:
+            boost.register(self.condition)
+        with self.condition:
+            ticket = (priority, next(self.sequence))
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while True:
+                    if boost is not None and boost.raised and ticket[0] > INTERACTIVE:
+                        # someone waits for this request now, it keeps its place among the interactive ones
+                        self.waiting.remove(ticket)
+                        ticket = (INTERACTIVE, ticket[1])
+                        self.waiting.append(ticket)
+                        heapq.heapify(self.waiting)
+                    now = time.monotonic()
+                    self.refill(now)
+                    timeout = None
+                    if self.waiting[0] == ticket and self.running < self.max_concurrency:
+                        if now < self.paused_until:
+                            timeout = self.paused_until - now
+                        elif self.tokens < needed:
+                            timeout = (needed - self.tokens) / self.rate
+                        else:
+                            heapq.heappop(self.waiting)
+                            self.tokens -= cost
+                            self.running += 1
+                            self.sent += 1
+                            self.condition.notify_all()
+                            return
+                    self.condition.wait(timeout)
+            except BaseException:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.condition.notify_all()
+                raise
+            finally:
+                if boost is not None:
+                    boost.unregister(self.condition)
+
+    def release(self):
+        with self.condition:
+            self.running -= 1
+            self.condition.notify_all()
+
+    def backoff(self, attempt: int, retry_after: float | None) -> float:
+        if retry_after is not None:
+            # a little more than asked, so the requests that waited do not all arrive at the same moment
+            return min(retry_after, self.max_delay) * random.uniform(1.0, 1.1)
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    def pause(self, delay: float):
+        with self.condition:
+            self.throttled += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self.condition.notify_all()
+        get_tracer().count_throttled(self.name)
+
+    def run(self, function: Callable, *args, cost: int = 1, priority: int | None = None):
+        if priority is None:
+            priority = current_priority.get()
+        boost = current_boost.get()
+        attempt = 0
+        while True:
+            delay = None
+            self.acquire(priority, cost, boost)
+            try:
+                return function(*args)
+            except RetryLater as retry:
+                if attempt >= self.max_retries:
+                    with self.condition:
+                        self.failed += 1
+                    if retry.error is not None:
+                        raise retry.error from None
+                    return retry.result
+                if retry.pause_backend:
+                    self.pause(self.backoff(attempt, retry.delay))
+                else:
+                    delay = self.backoff(attempt, retry.delay)
+                    with self.condition:
+                        self.retried += 1
+                attempt += 1
+            finally:
+                self.release()
+            if delay is not None:
+                # waits without its slot, the other requests keep going
+                time.sleep(delay)
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from assistants.dialogueSession import DialogueSession
+from assistants.conversationJournal import ConversationJournal
+
+
+class SessionStore():
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        ttl: float = 3600.0,
+        memory_limit: int = 64 * 1024 * 1024,
+        spill_directory: str | None = None,
+        journal: ConversationJournal | None = None,
+    ):
+        # sessions beyond any of these limits are evicted, least recently used first
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.memory_limit = memory_limit
+        # evicted sessions are written here and picked up again when they come back
+        self.spill_directory = spill_directory
+        if spill_directory is not None:
+            os.makedirs(spill_directory, exist_ok = True)
+        # every turn is logged here, so sessions survive a restart of the process
+        self.journal = journal
+
+        self.lock = threading.RLock()
+        self.sessions: OrderedDict[str, DialogueSession] = OrderedDict()
+        self.last_used: dict[str, float] = {}
+        self.sizes: dict[str, int] = {}
+        self.total_size: int = 0
+        # sessions with a turn in progress, they are never evicted under the running turn
+        self.in_use: dict[str, int] = {}
+
+    def spill_path(self, session_id: str) -> str:
+        # a hash instead of the filtered id, so ids like "a.b" and "ab" do not share a file
+        safe_id = hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_directory, f"{safe_id}.json")
+
+    def get(self, session_id: str) -> DialogueSession:
+        # the session stays pinned until its turn is recorded or released
+        with self.lock:
+            self.in_use[session_id] = self.in_use.get(session_id, 0) + 1
+            self.evict_expired()
+            if session_id in self.sessions:
+                self.sessions.move_to_end(session_id)
+                self.last_used[session_id] = time.monotonic()
+                return self.sessions[session_id]
+
+            session = self.load(session_id)
+            if session is None:
+                session = DialogueSession(session_id)
+            self.put(session)
+            return session
+
+    def release(self, session: DialogueSession):
+        with self.lock:
+            count = self.in_use.get(session.session_id, 0) - 1
+            if count > 0:
+                self.in_use[session.session_id] = count
+            else:
+                self.in_use.pop(session.session_id, None)
+
+    def put(self, session: DialogueSession):
+        with self.lock:
+            self.sessions[session.session_id] = session
+            self.sessions.move_to_end(session.session_id)
+            self.last_used[session.session_id] = time.monotonic()
+            self.update_size(session)
+
+    def record_turn(self, session: DialogueSession):
+        if self.journal is not None:
+            self.journal.record_turn(session)
+        else:
+            # nothing reads the changes without a journal, they would pile up for the life of the session
+            session.clear_journal_delta()
+        self.release(session)
+        self.update_size(session)
+
+    def update_size(self, session: DialogueSession):
+        # called after every turn, so the memory limit follows the growth of the conversations
+        with self.lock:
+            if session.session_id not in self.sessions:
+                return
+            size = session.estimate_size()
+            self.total_size += size - self.sizes.get(session.session_id, 0)
+            self.sizes[session.session_id] = size
+            for oldest_id in [session_id for session_id in self.sessions if session_id not in self.in_use]:
+                if not (len(self.sessions) > 1 and (len(self.sessions) > self.max_sessions or self.total_size > self.memory_limit)):
+                    break
+                self.evict(oldest_id)
+
+    def remove(self, session_id: str):
+        with self.lock:
+            self.drop(session_id)
+            self.in_use.pop(session_id, None)
+            if self.journal is not None:
+                self.journal.record_end(session_id)
+            self.remove_spill(session_id)
+
+    def drop(self, session_id: str) -> DialogueSession | None:
+        session = self.sessions.pop(session_id, None)
+        self.last_used.pop(session_id, None)
+        self.total_size -= self.sizes.pop(session_id, 0)
+        return session
+
+    def evict(self, session_id: str):
+        session = self.drop(session_id)
+        if session is not None and self.spill_directory is not None and session.is_alive:
+            self.spill(session)
+
+    def evict_expired(self):
+        now = time.monotonic()
+        # sessions are ordered by last use, so the expired ones are all at the front
+        for oldest_id in list(self.sessions):
+            if now - self.last_used[oldest_id] <= self.ttl:
+                break
+            if oldest_id not in self.in_use:
+                self.evict(oldest_id)
+
+    def spill(self, session: DialogueSession):
+        path = self.spill_path(session.session_id)
+        with open(path + ".tmp", "w") as file:
+            json.dump(session.to_dict(), file)
+        os.replace(path + ".tmp", path)
+
+    def load(self, session_id: str) -> DialogueSession | None:
+        # the journal has every turn, a spill file only the state at the time of the eviction
+        if self.journal is not None:
+            session = self.journal.restore(session_id)
+            if session is not None:
+                self.remove_spill(session_id)
+                return session
+        if self.spill_directory is None or not os.path.exists(self.spill_path(session_id)):
+            return None
+        try:
+            with open(self.spill_path(session_id)) as file:
+                session = DialogueSession.from_dict(json.load(file))
+        except Exception as error:
+            print(f"Session {session_id} could not be restored: {error}")
+            return None
+        # the session lives in memory again, an old copy on disk must not come back after later turns
+        self.remove_spill(session_id)
+        return session
+
+    def remove_spill(self, session_id: str):
+        if self.spill_directory is not None and os.path.exists(self.spill_path(session_id)):
+            os.remove(self.spill_path(session_id))
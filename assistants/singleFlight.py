@@ -0,0 +1,54 @@
+import threading
+from typing import Any, Callable, Hashable
+
+
+class Flight():
+
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.waiters: int = 0
+
+
+class SingleFlight():
+
+    # Calls with the same key that overlap in time share one execution: the first caller runs the
+    # function, everyone who arrives while it runs waits for it and gets the same result or error.
+    # Nothing is cached, a call that starts after the last one finished runs again.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights: dict[Hashable, Flight] = {}
+        # calls that were answered by another caller's execution
+        self.coalesced: int = 0
+
+    def do(self, key: Hashable, function: Callable, *args, **kwargs):
+        with self.lock:
+            flight = self.flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = Flight()
+                self.flights[key] = flight
+            else:
+                flight.waiters += 1
+                self.coalesced += 1
+
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = function(*args, **kwargs)
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result
@@ -0,0 +1,132 @@
+from typing import Iterable, Literal
+from assistants.toolCallParser import parse_tool_calls
+
+
+# languages of a code fence the model puts a tool call in
+CALL_FENCE_LANGUAGES = ("", "json", "json5", "jsonc")
+
+
+class ToolCallDetector():
+
+    # Decides from the first characters of a streamed completion whether it is a plain text answer
+    # or a JSON tool call, and tracks bracket depth so a tool call can be dispatched once it closes.
+    # Text is only handed out for printing up to the first point where a call could start inside the prose,
+    # the rest follows once the whole completion has been ruled out as a call.
+
+    def __init__(self, tool_names: Iterable[str] = ()):
+        self.tool_names = list(tool_names)
+        self.buffer: str = ""
+        self.mode: Literal["undecided", "text", "tool_call"] = "undecided"
+        self.is_complete: bool = False
+
+        # how much of a text answer was handed out and where a possible call in it starts
+        self.released: int = 0
+        self.held_from: int | None = None
+
+        self.depth: int = 0
+        self.in_string: bool = False
+        self.escaped: bool = False
+        self.scanned: int = 0
+        self.end: int = 0
+
+    def feed(self, delta: str) -> str:
+        self.buffer += delta
+        if self.mode == "undecided":
+            self.decide()
+        if self.mode == "tool_call":
+            self.scan()
+        return self.mode
+
+    def decide(self):
+        stripped = self.buffer.lstrip()
+        if stripped == "":
+            return
+        if stripped[0] in "[{":
+            self.mode = "tool_call"
+        elif "```".startswith(stripped[:3]):
+            if len(stripped) < 3:
+                return
+            # a fence is only a call when its language is JSON and its content starts like JSON,
+            # so a shell or python block at the start of an answer is still streamed
+            if "\n" not in stripped:
+                return
+            fence_line, content = stripped[3:].split("\n", 1)
+            content = content.lstrip()
+            if fence_line.strip().lower() not in CALL_FENCE_LANGUAGES:
+                self.mode = "text"
+            elif content != "":
+                self.mode = "tool_call" if content[0] in "[{" else "text"
+        else:
+            self.mode = "text"
+
+    def take_printable(self) -> str:
+        # the text that arrived since the last call, up to where a tool call could start
+        if self.mode != "text":
+            return ""
+        if self.held_from is None:
+            self.held_from = self.find_call_start()
+        end = self.held_from if self.held_from is not None else len(self.buffer.rstrip("`"))
+        text = self.buffer[self.released:end]
+        self.released = max(self.released, end)
+        return text
+
+    def find_call_start(self) -> int | None:
+        # the first bracket outside of a code block, or the first code fence that could hold JSON
+        opening = True
+        position = 0
+        while True:
+            fence = self.buffer.find("```", position)
+            if opening:
+                prose = self.buffer[position:fence if fence != -1 else len(self.buffer)]
+                brackets = [index for index in (prose.find("["), prose.find("{")) if index != -1]
+                if brackets:
+                    return position + min(brackets)
+            if fence == -1:
+                return None
+            if opening:
+                line_end = self.buffer.find("\n", fence)
+                if line_end == -1 or self.buffer[fence + 3:line_end].strip().lower() in CALL_FENCE_LANGUAGES:
+                    return fence
+            position = fence + 3
+            opening = not opening
+
+    def finish(self) -> str | None:
+        # the held back rest of a text answer, None when the completion turned out to hold a call after all
+        if self.mode != "text":
+            return None
+        if self.held_from is not None and parse_tool_calls(self.buffer, self.tool_names).kind != "text":
+            return None
+        text = self.buffer[self.released:]
+        self.released = len(self.buffer)
+        return text
+
+    def scan(self):
+        # only the characters that arrived since the last call are looked at
+        for char in self.buffer[self.scanned:]:
+            if self.is_complete:
+                break
+            self.scanned += 1
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"' and self.depth > 0:
+                self.in_string = True
+            elif char in "[{":
+                self.depth += 1
+            elif char in "]}" and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.is_complete = True
+                    self.end = self.scanned
+
+    def get_tool_call(self) -> str:
+        # the closed JSON value without a leading code fence or trailing text
+        start = min(
+            [index for index in (self.buffer.find("["), self.buffer.find("{")) if index != -1],
+            default = 0
+        )
+        return self.buffer[start:self.end if self.is_complete else len(self.buffer)]
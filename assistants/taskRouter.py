@@ -0,0 +1,53 @@
+import re
+
+
+class TaskRouter():
+
+    # Decides locally which assistant a user request belongs to, so that clear cases do not need
+    # an extra LLM call on the manager just to produce assign_task_to.
+
+    def __init__(self, threshold: float = 0.8):
+        # routes below this confidence are left to the manager LLM
+        self.threshold = threshold
+
+        self.backend_patterns: dict[str, list[tuple[re.Pattern, float]]] = {
+            "Google": [
+                (re.compile(r"\bgoogle\b", re.IGNORECASE), 0.95),
+                (re.compile(r"\bg-?cal(endar)?\b|\bgmail\b", re.IGNORECASE), 0.9),
+            ],
+            "Nextcloud": [
+                (re.compile(r"\bnext ?cloud\b", re.IGNORECASE), 0.95),
+                (re.compile(r"\bcaldav\b|\bsympalog\b", re.IGNORECASE), 0.9),
+            ],
+        }
+        # follow-ups about one event, they go to the backend the session used last. General questions like
+        # "what is on my schedule" or "am I free" are left to the manager, which reads every calendar
+        self.calendar_pattern = re.compile(
+            r"\b(reschedule|cancel|move|delete|remove|rename|book|remind(er)?|verschieben|absagen|löschen)\b|"
+            r"\b(that|this|the same|it'?s) (event|appointment|meeting|termin)\b|\b(diesen|den) termin\b",
+            re.IGNORECASE,
+        )
+        self.sticky_confidence = 0.85
+        # a session talking to one backend is moved to another only when that one is named
+        self.switch_threshold = 0.9
+
+    def score(self, text: str, last_target: str | None = None) -> dict[str, float]:
+        scores = {}
+        for (target, patterns) in self.backend_patterns.items():
+            confidence = max((weight for (pattern, weight) in patterns if pattern.search(text)), default = 0.0)
+            if confidence > 0:
+                scores[target] = confidence
+
+        if len(scores) == 0 and last_target is not None and self.calendar_pattern.search(text):
+            scores[last_target] = self.sticky_confidence
+        return scores
+
+    def route(self, text: str, last_target: str | None = None) -> tuple[str | None, float]:
+        scores = self.score(text, last_target)
+        if len(scores) != 1:
+            # nothing matched or several backends are named, the manager has to ask
+            return None, 0.0
+        target, confidence = next(iter(scores.items()))
+        if confidence < self.threshold:
+            return None, confidence
+        return target, confidence
@@ -0,0 +1,224 @@
+import json
+import re
+from typing import Iterable, Literal
+
+
+FENCED_BLOCK = re.compile(r"```[a-zA-Z]*\s*(.*?)(?:```|$)", re.DOTALL)
+PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+# the characters that end a string, depending on the quote it was opened with
+DOUBLE_CLOSING = ('"', "“", "”")
+SINGLE_CLOSING = ("'", "‘", "’")
+# control characters JSON does not allow unescaped inside strings
+STRING_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+class ParsedResponse():
+
+    __slots__ = ("kind", "calls", "error")
+
+    def __init__(self, kind: Literal["text", "tool_calls", "malformed"], calls: list[dict] | None = None, error: str | None = None):
+        # text is a final answer, malformed looked like a tool call but could not be read
+        self.kind = kind
+        self.calls = calls if calls is not None else []
+        self.error = error
+
+
+def json_segments(text: str) -> list[str]:
+    # every top level JSON object or list in the text, the last one may still be open
+    segments = []
+    depth = 0
+    in_string = False
+    escaped = False
+    start = 0
+    for (index, char) in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"' and depth > 0:
+            in_string = True
+        elif char in "[{":
+            if depth == 0:
+                start = index
+            depth += 1
+        elif char in "]}" and depth > 0:
+            depth -= 1
+            if depth == 0:
+                segments.append(text[start:index + 1])
+    if depth > 0:
+        segments.append(text[start:])
+    return segments
+
+
+def close_open_brackets(text: str) -> str:
+    # completes output that was cut off, e.g. by the token limit or an aborted stream
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "[{":
+            stack.append("]" if char == "[" else "}")
+        elif char in "]}" and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    text = text.rstrip().rstrip(",:")
+    return text + "".join(reversed(stack))
+
+
+def repair_json(text: str) -> str:
+    # the mistakes models make most often: smart quotes, single quotes, python literals,
+    # unquoted keys, trailing commas, raw line breaks in strings and output that stops in the middle.
+    # one scan that knows where the strings are, so their content is never rewritten
+    result = []
+    index = 0
+    length = len(text)
+    while index < length:
+        char = text[index]
+        if char in "\"'“”‘’":
+            index = copy_string(text, index, result)
+            continue
+        if char.isalpha() or char == "_":
+            word_end = index
+            while word_end < length and (text[word_end].isalnum() or text[word_end] == "_"):
+                word_end += 1
+            word = text[index:word_end]
+            if word in PYTHON_LITERALS:
+                result.append(PYTHON_LITERALS[word])
+            elif word not in ("true", "false", "null") and next_char(text, word_end) == ":":
+                # an unquoted key
+                result.append(f'"{word}"')
+            else:
+                result.append(word)
+            index = word_end
+            continue
+        if char == "," and next_char(text, index + 1) in ("}", "]"):
+            # trailing comma
+            index += 1
+            continue
+        result.append(char)
+        index += 1
+    return close_open_brackets("".join(result))
+
+
+def next_char(text: str, index: int) -> str:
+    # the first character from index on that is not whitespace, empty at the end of the text
+    while index < len(text) and text[index].isspace():
+        index += 1
+    return text[index:index + 1]
+
+
+def copy_string(text: str, index: int, result: list[str]) -> int:
+    # copies the string starting at index as a double quoted JSON string and returns the index after it
+    opening = text[index]
+    single = opening in "'‘’"
+    # a string opened with a plain quote keeps the smart quotes in its text
+    closing = SINGLE_CLOSING if single else DOUBLE_CLOSING if opening != '"' else ('"',)
+    result.append('"')
+    index += 1
+    while index < len(text):
+        char = text[index]
+        if char == "\\" and index + 1 < len(text):
+            result.append(text[index:index + 2])
+            index += 2
+            continue
+        if char in closing:
+            # an apostrophe inside a single quoted string does not end it, only one before , : } ] or the end does
+            if not single or next_char(text, index + 1) in ("", ",", ":", "}", "]"):
+                result.append('"')
+                return index + 1
+        if char == '"':
+            result.append('\\"')
+        elif char in STRING_ESCAPES:
+            result.append(STRING_ESCAPES[char])
+        else:
+            result.append(char)
+        index += 1
+    # cut off in the middle of the string, close_open_brackets finishes it
+    return index
+
+
+def load_json(text: str):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return json.loads(repair_json(text))
+
+
+def normalize_call(call) -> dict | None:
+    # accepts {"name", "arguments"} as well as the OpenAI shape {"function": {"name", "arguments"}}
+    if not isinstance(call, dict):
+        return None
+    if isinstance(call.get("function"), dict):
+        call = call["function"]
+    name = call.get("name")
+    if not isinstance(name, str):
+        return None
+    arguments = call.get("arguments", call.get("parameters", {}))
+    if isinstance(arguments, str):
+        # some models send the arguments as a JSON string
+        arguments = load_json(arguments) if arguments.strip() else {}
+    if arguments is None:
+        arguments = {}
+    return {"name": name, "arguments": arguments}
+
+
+def normalize_calls(value) -> list[dict] | None:
+    if isinstance(value, dict) and isinstance(value.get("tool_calls"), list):
+        value = value["tool_calls"]
+    values = value if isinstance(value, list) else [value]
+    calls = [normalize_call(call) for call in values]
+    if len(calls) == 0 or any(call is None for call in calls):
+        return None
+    return calls
+
+
+def parse_tool_calls(text: str, tool_names: Iterable[str] = ()) -> ParsedResponse:
+    # finds the tool calls in a completion even when they come with prose, in code fences or cut off
+
+    tool_names = set(tool_names)
+    stripped = text.strip()
+    fenced = [block for block in FENCED_BLOCK.findall(stripped) if block.strip()]
+    candidates = fenced + json_segments(stripped) if fenced else json_segments(stripped)
+
+    # a completion that starts like JSON or mentions a tool was meant as a call, if it cannot be read it is worth a re-ask,
+    # a code fence only counts when it holds JSON or names a tool, not for a shell or python snippet in an answer
+    looks_like_call = (
+        stripped[:1] in ("[", "{")
+        or any(block.lstrip()[:1] in ("[", "{") or any(name in block for name in tool_names) for block in fenced)
+        or any(f'"{name}"' in stripped for name in tool_names)
+    )
+
+    error = None
+    for candidate in candidates:
+        try:
+            calls = normalize_calls(load_json(candidate))
+        except (json.JSONDecodeError, ValueError) as decode_error:
+            error = str(decode_error)
+            continue
+        if calls is None:
+            continue
+        # JSON that names no known tool is part of the answer, e.g. an example the model shows the user
+        if tool_names and not all(call["name"] in tool_names for call in calls):
+            unknown = [call["name"] for call in calls if call["name"] not in tool_names]
+            if stripped[:1] in ("[", "{"):
+                return ParsedResponse("tool_calls", calls)
+            error = f"unknown function {', '.join(unknown)}"
+            continue
+        return ParsedResponse("tool_calls", calls)
+
+    if looks_like_call:
+        return ParsedResponse("malformed", error = error if error is not None else "no function name and arguments found")
+    return ParsedResponse("text")
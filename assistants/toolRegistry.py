@@ -0,0 +1,181 @@
+import inspect
+import types
+import typing
+from typing import Any, Callable, Literal
+
+
+# python annotations and the JSON schema types they are offered to the model as
+SCHEMA_TYPES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    dict: "object",
+    list: "array",
+}
+
+
+def annotation_schema(annotation) -> dict:
+    # turns the annotation of a tool parameter into its JSON schema
+    origin = typing.get_origin(annotation)
+    if origin is Literal:
+        return {"type": "string", "enum": list(typing.get_args(annotation))}
+    if origin in (typing.Union, types.UnionType):
+        # optional parameters are written as `str | None = None`, the model only sees the type
+        arguments = [argument for argument in typing.get_args(annotation) if argument is not type(None)]
+        return annotation_schema(arguments[0])
+    if origin is list:
+        arguments = typing.get_args(annotation)
+        schema = {"type": "array"}
+        if arguments:
+            schema["items"] = annotation_schema(arguments[0])
+        return schema
+    if annotation in SCHEMA_TYPES:
+        return {"type": SCHEMA_TYPES[annotation]}
+    raise TypeError(f"Tool parameters annotated with {annotation} need an explicit schema")
+
+
+def compile_validator(schema: dict) -> Callable[[Any, str], Any]:
+    # builds the check for one value once, so validating a call is a few isinstance checks
+    # the validator returns the value, numbers written as strings are converted on the way
+
+    kind = schema.get("type")
+    if "enum" in schema:
+        allowed = set(schema["enum"])
+
+        def validate_enum(value, path):
+            if value not in allowed:
+                raise ValueError(f"{path} has to be one of {', '.join(map(str, schema['enum']))}")
+            return value
+        return validate_enum
+
+    if kind == "string":
+        def validate_string(value, path):
+            if not isinstance(value, str):
+                raise ValueError(f"{path} has to be a string")
+            return value
+        return validate_string
+
+    if kind in ("integer", "number"):
+        number_type = int if kind == "integer" else float
+        expected = "an integer" if kind == "integer" else "a number"
+
+        def validate_number(value, path):
+            if isinstance(value, bool):
+                raise ValueError(f"{path} has to be {expected}")
+            if isinstance(value, str):
+                try:
+                    return number_type(value.strip())
+                except ValueError:
+                    raise ValueError(f"{path} has to be {expected}") from None
+            if kind == "integer" and isinstance(value, float) and value.is_integer():
+                return int(value)
+            if not isinstance(value, int if kind == "integer" else (int, float)):
+                raise ValueError(f"{path} has to be {expected}")
+            return value
+        return validate_number
+
+    if kind == "boolean":
+        def validate_boolean(value, path):
+            if not isinstance(value, bool):
+                raise ValueError(f"{path} has to be true or false")
+            return value
+        return validate_boolean
+
+    if kind == "array":
+        validate_item = compile_validator(schema["items"]) if "items" in schema else None
+
+        def validate_array(value, path):
+            if not isinstance(value, list):
+                raise ValueError(f"{path} has to be a list")
+            if validate_item is None:
+                return value
+            return [validate_item(item, f"{path}[{index}]") for (index, item) in enumerate(value)]
+        return validate_array
+
+    if kind == "object":
+        return compile_object_validator(schema)
+
+    return lambda value, path: value
+
+
+def compile_object_validator(schema: dict) -> Callable[[Any, str], dict]:
+    properties = {name: compile_validator(property_schema) for (name, property_schema) in schema.get("properties", {}).items()}
+    required = tuple(schema.get("required", []))
+
+    def validate_object(value, path):
+        if not isinstance(value, dict):
+            raise ValueError(f"{path} has to be an object" if path else "the arguments have to be an object")
+        for name in required:
+            if value.get(name) is None:
+                raise ValueError(f"{path}.{name} is missing" if path else f"{name} is missing")
+        # arguments the tool does not know are dropped instead of failing the call
+        return {
+            name: properties[name](argument, f"{path}.{name}" if path else name)
+            for (name, argument) in value.items()
+            if name in properties and argument is not None
+        }
+    return validate_object
+
+
+class ToolSpec():
+
+    # one tool: its schema for the model and everything needed to call it, built once per class
+
+    def __init__(self, function: Callable, name: str, description: str, read_only: bool, failure: str | None, parameters: dict[str, dict]):
+        self.function = function
+        self.name = name
+        self.read_only = read_only
+        # the start of the sentence the model gets when the tool raises
+        self.failure = failure if failure is not None else f"{name} failed"
+
+        signature = inspect.signature(function)
+        hints = typing.get_type_hints(function)
+        # tools that need the conversation take a `state` parameter, it is not shown to the model
+        self.takes_state = "state" in signature.parameters
+
+        properties = {}
+        required = []
+        for (parameter_name, parameter) in signature.parameters.items():
+            if parameter_name in ("self", "state"):
+                continue
+            if parameter_name in parameters:
+                properties[parameter_name] = parameters[parameter_name]
+            else:
+                properties[parameter_name] = annotation_schema(hints[parameter_name])
+            if parameter.default is inspect.Parameter.empty:
+                required.append(parameter_name)
+
+        self.schema: dict = {
+            "type": "function",
+            "function": {
+                "name": name,
+                "description": description,
+                "parameters": {
+                    "type": "object",
+                    "properties": properties,
+                    "required": required,
+                },
+            },
+        }
+        self.validate: Callable[[Any, str], dict] = compile_object_validator(self.schema["function"]["parameters"])
+
+
+def tool(name: str, description: str, read_only: bool = False, failure: str | None = None, parameters: dict[str, dict] | None = None):
+    # marks a manager method as a tool, ManagerStructure collects the marked methods when the class is created
+    # parameters holds schemas for arguments whose annotation is not enough, e.g. lists of objects
+    def decorate(function: Callable) -> Callable:
+        function.tool_spec = ToolSpec(function, name, description, read_only, failure, parameters or {})
+        return function
+    return decorate
+
+
+def collect_tools(cls: type) -> dict[str, ToolSpec]:
+    # base classes first, so their tools come first and subclasses can replace them by name
+    specs: dict[str, ToolSpec] = {}
+    for klass in reversed(cls.__mro__):
+        for attribute in vars(klass).values():
+            spec = getattr(attribute, "tool_spec", None)
+            if isinstance(spec, ToolSpec):
+                specs[spec.name] = spec
+    return specs
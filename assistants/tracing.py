@@ -0,0 +1,207 @@
+import contextvars
+import json
+import threading
+import time
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest
+
+
+class NullSpan():
+
+    # stands in for spans and turns while tracing is disabled, so the instrumented code costs one call
+
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span():
+
+    __slots__ = ("tracer", "kind", "name", "attributes", "started", "duration", "error")
+
+    def __init__(self, tracer: "Tracer", kind: str, name: str, attributes: dict):
+        self.tracer = tracer
+        # llm, tool or backend
+        self.kind = kind
+        self.name = name
+        self.attributes = attributes
+        self.started: float = 0.0
+        self.duration: float = 0.0
+        self.error: str | None = None
+
+    def __enter__(self) -> "Span":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        self.duration = time.perf_counter() - self.started
+        if error_type is not None:
+            self.error = error_type.__name__
+        self.tracer.finish_span(self)
+        return False
+
+    def set(self, **attributes):
+        # for values that are only known once the call returned
+        self.attributes.update(attributes)
+
+    def to_dict(self, turn_started: float) -> dict:
+        record = {
+            "kind": self.kind,
+            "name": self.name,
+            "offset_ms": round(1000 * (self.started - turn_started), 3),
+            "duration_ms": round(1000 * self.duration, 3),
+        }
+        if self.error is not None:
+            record["error"] = self.error
+        record.update(self.attributes)
+        return record
+
+
+class Turn():
+
+    __slots__ = ("session_id", "started", "duration", "spans", "handoffs", "error")
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.started: float = 0.0
+        self.duration: float = 0.0
+        # appended from the tool threads as well, list.append does not need a lock
+        self.spans: list[Span] = []
+        self.handoffs: int = 0
+        self.error: str | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "session": self.session_id,
+            "timestamp": time.time(),
+            "duration_ms": round(1000 * self.duration, 3),
+            "handoffs": self.handoffs,
+            "error": self.error,
+            "spans": [span.to_dict(self.started) for span in self.spans],
+        }
+
+
+class TurnContext():
+
+    def __init__(self, tracer: "Tracer", turn: Turn):
+        self.tracer = tracer
+        self.turn = turn
+        self.token = None
+
+    def __enter__(self) -> Turn:
+        self.token = self.tracer.current_turn.set(self.turn)
+        self.turn.started = time.perf_counter()
+        return self.turn
+
+    def __exit__(self, error_type, error, traceback):
+        self.turn.duration = time.perf_counter() - self.turn.started
+        if error_type is not None:
+            self.tracer.record_error(error)
+        self.tracer.current_turn.reset(self.token)
+        self.tracer.finish_turn(self.turn)
+        return False
+
+
+class Tracer():
+
+    def __init__(self, enabled: bool = False, trace_path: str | None = None):
+        self.enabled = enabled
+        # every finished turn is appended to this file as one JSON line
+        self.trace_path = trace_path
+        self.write_lock = threading.Lock()
+
+        # a contextvar instead of a thread local, so the tool threads can be handed the turn they belong to
+        self.current_turn: contextvars.ContextVar[Turn | None] = contextvars.ContextVar("current_turn", default = None)
+
+        self.registry = CollectorRegistry()
+        self.turn_seconds = Histogram("assistant_turn_seconds", "Duration of a whole dialogue turn", registry = self.registry)
+        self.turn_errors = Counter("assistant_turn_errors", "Turns that raised or recovered from an exception", ["error"], registry = self.registry)
+        self.handoffs = Counter("assistant_handoffs", "Handoffs between the manager and the calendar assistants", registry = self.registry)
+        self.span_seconds = Histogram("assistant_span_seconds", "Duration of LLM, tool and backend calls", ["kind", "name"], registry = self.registry)
+        self.span_errors = Counter("assistant_span_errors", "LLM, tool and backend calls that raised", ["kind", "name", "error"], registry = self.registry)
+        self.prompt_bytes = Counter("assistant_llm_prompt_bytes", "Bytes of the messages sent to the LLM", registry = self.registry)
+        self.prompt_tokens = Counter("assistant_llm_prompt_tokens", "Estimated tokens of the messages sent to the LLM", registry = self.registry)
+        self.throttled = Counter("assistant_backend_throttled", "Calendar requests the server answered as overloaded or over quota", ["backend"], registry = self.registry)
+        self.prefetch_reads = Counter("assistant_prefetch_reads", "Calendar reads answered from a prefetch (hit) or not (miss)", ["backend", "result"], registry = self.registry)
+
+    def turn(self, session_id: str) -> TurnContext | NullSpan:
+        if not self.enabled:
+            return NULL_SPAN
+        return TurnContext(self, Turn(session_id))
+
+    def span(self, kind: str, name: str, **attributes) -> Span | NullSpan:
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, kind, name, attributes)
+
+    def count_handoff(self):
+        if not self.enabled:
+            return
+        self.handoffs.inc()
+        turn = self.current_turn.get()
+        if turn is not None:
+            turn.handoffs += 1
+
+    def count_prefetch(self, backend: str, hit: bool):
+        if not self.enabled:
+            return
+        self.prefetch_reads.labels(backend, "hit" if hit else "miss").inc()
+
+    def count_throttled(self, backend: str):
+        if not self.enabled:
+            return
+        self.throttled.labels(backend).inc()
+
+    def record_error(self, error: Exception):
+        # for errors the turn recovers from, e.g. a completion that is no valid tool call
+        if not self.enabled:
+            return
+        self.turn_errors.labels(type(error).__name__).inc()
+        turn = self.current_turn.get()
+        if turn is not None:
+            turn.error = type(error).__name__
+
+    def finish_span(self, span: Span):
+        self.span_seconds.labels(span.kind, span.name).observe(span.duration)
+        if span.error is not None:
+            self.span_errors.labels(span.kind, span.name, span.error).inc()
+        if span.kind == "llm":
+            self.prompt_bytes.inc(span.attributes.get("bytes", 0))
+            self.prompt_tokens.inc(span.attributes.get("tokens", 0))
+
+        turn = self.current_turn.get()
+        if turn is not None:
+            turn.spans.append(span)
+
+    def finish_turn(self, turn: Turn):
+        self.turn_seconds.observe(turn.duration)
+
+        if self.trace_path is not None:
+            line = json.dumps(turn.to_dict(), default = str)
+            with self.write_lock:
+                with open(self.trace_path, "a", encoding = "utf-8") as trace_file:
+                    trace_file.write(line + "\n")
+
+    def render_metrics(self) -> bytes:
+        # prometheus text exposition format
+        return generate_latest(self.registry)
+
+
+# the tracer every module reports to, the backends have no reference to the assistant
+tracer: Tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return tracer
+
+
+def set_tracer(new_tracer: Tracer):
+    global tracer
+    tracer = new_tracer
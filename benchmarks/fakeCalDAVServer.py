@@ -0,0 +1,228 @@
+import datetime
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+
+PRINCIPAL_PATH = "/dav/principals/benchmark/"
+HOME_PATH = "/dav/calendars/benchmark/"
+CALENDAR_NAME = "benchmark"
+CALENDAR_PATH = f"{HOME_PATH}{CALENDAR_NAME}/"
+
+
+def parse_ics_time(value: str) -> datetime.datetime:
+    value = value.strip()
+    if len(value) == 8:
+        return datetime.datetime.strptime(value, "%Y%m%d").replace(tzinfo = datetime.timezone.utc)
+    return datetime.datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S").replace(tzinfo = datetime.timezone.utc)
+
+
+class FakeCalDAVServer():
+
+    # A small in-memory CalDAV server with one calendar, enough for caldav.DAVClient to discover the
+    # principal and calendar, run calendar-query and sync-collection reports, and GET/PUT/DELETE objects.
+
+    def __init__(self, port: int = 0, latency: float = 0.01, quota: int | None = None):
+        # seconds every request takes, to stand in for the network round trip
+        self.latency = latency
+        # requests per second that are answered, the ones above it get 429 with Retry-After
+        self.quota = quota
+        self.quota_second: int = 0
+        self.quota_used: int = 0
+        self.throttled: int = 0
+
+        self.lock = threading.Lock()
+        # href -> (ics, etag)
+        self.objects: dict[str, tuple[str, str]] = {}
+        # every change bumps the sequence, the sync token is the sequence
+        self.sequence: int = 0
+        self.changed_at: dict[str, int] = {}
+        self.deleted: set[str] = set()
+        self.requests: int = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            protocol_version = "HTTP/1.1"
+
+            def handle_any(self):
+                length = int(self.headers.get("Content-Length", "0"))
+                body = self.rfile.read(length).decode("utf-8") if length > 0 else ""
+                with server.lock:
+                    server.requests += 1
+                time.sleep(server.latency)
+                if server.over_quota():
+                    self.send_throttled()
+                    return
+
+                status, content_type, payload, headers = server.handle(self.command, self.path.split("?")[0], self.headers, body)
+                data = payload.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for (name, value) in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_PUT = do_DELETE = do_PROPFIND = do_REPORT = do_OPTIONS = handle_any
+
+            def send_throttled(self):
+                payload = b''
+                self.send_response(429)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(payload)))
+                self.send_header("Retry-After", "1")
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}/dav/"
+        self.credentials = {"login": "benchmark", "pass": "benchmark", "calendar_name": CALENDAR_NAME}
+
+    def over_quota(self) -> bool:
+        if self.quota is None:
+            return False
+        with self.lock:
+            second = int(time.time())
+            if second != self.quota_second:
+                self.quota_second = second
+                self.quota_used = 0
+            self.quota_used += 1
+            if self.quota_used > self.quota:
+                self.throttled += 1
+                return True
+            return False
+
+    def start(self):
+        threading.Thread(target = self.server.serve_forever, daemon = True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_event(self, summary: str, start: str, end: str) -> str:
+        uid = uuid.uuid4().hex
+        ics = (
+            "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//benchmark//EN\r\nBEGIN:VEVENT\r\n"
+            f"UID:{uid}\r\nDTSTAMP:20250101T000000Z\r\nDTSTART:{start}\r\nDTEND:{end}\r\nSUMMARY:{summary}\r\n"
+            "END:VEVENT\r\nEND:VCALENDAR\r\n"
+        )
+        with self.lock:
+            self.store(f"{CALENDAR_PATH}{uid}.ics", ics)
+        return uid
+
+    def store(self, href: str, ics: str):
+        self.sequence += 1
+        self.objects[href] = (ics, f'"{uuid.uuid4().hex}"')
+        self.changed_at[href] = self.sequence
+        self.deleted.discard(href)
+
+    def multistatus(self, responses: list[str], extra: str = "") -> tuple[int, str, str, dict]:
+        body = (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<d:multistatus xmlns:d="DAV:" xmlns:cal="urn:ietf:params:xml:ns:caldav" xmlns:cs="http://calendarserver.org/ns/">'
+            + "".join(responses) + extra + "</d:multistatus>"
+        )
+        return 207, "application/xml; charset=utf-8", body, {}
+
+    def response(self, href: str, props: str, status: str = "HTTP/1.1 200 OK") -> str:
+        return f"<d:response><d:href>{href}</d:href><d:propstat><d:prop>{props}</d:prop><d:status>{status}</d:status></d:propstat></d:response>"
+
+    def object_response(self, href: str, with_data: bool) -> str:
+        ics, etag = self.objects[href]
+        props = f"<d:getetag>{escape(etag)}</d:getetag>"
+        if with_data:
+            props += f"<cal:calendar-data>{escape(ics)}</cal:calendar-data>"
+        return self.response(href, props)
+
+    def overlaps(self, ics: str, start: datetime.datetime | None, end: datetime.datetime | None) -> bool:
+        if start is None and end is None:
+            return True
+        event_start = parse_ics_time(re.search(r"^DTSTART[^:]*:(.*)$", ics, re.MULTILINE).group(1))
+        end_match = re.search(r"^DTEND[^:]*:(.*)$", ics, re.MULTILINE)
+        event_end = parse_ics_time(end_match.group(1)) if end_match else event_start
+        return (end is None or event_start < end) and (start is None or event_end > start)
+
+    def handle(self, method: str, path: str, headers, body: str) -> tuple[int, str, str, dict]:
+        with self.lock:
+            if method == "OPTIONS":
+                return 200, "text/plain", "", {"DAV": "1, 2, 3, calendar-access"}
+
+            if method == "PROPFIND":
+                depth = headers.get("Depth", "0")
+                if "current-user-principal" in body:
+                    return self.multistatus([self.response(path, f"<d:current-user-principal><d:href>{PRINCIPAL_PATH}</d:href></d:current-user-principal>")])
+                if "calendar-home-set" in body:
+                    return self.multistatus([self.response(path, f"<cal:calendar-home-set><d:href>{HOME_PATH}</d:href></cal:calendar-home-set>")])
+                calendar_props = (
+                    f"<d:resourcetype><d:collection/><cal:calendar/></d:resourcetype><d:displayname>{CALENDAR_NAME}</d:displayname>"
+                    f"<cs:getctag>{self.sequence}</cs:getctag><d:sync-token>{self.sequence}</d:sync-token>"
+                    '<cal:supported-calendar-component-set><cal:comp name="VEVENT"/></cal:supported-calendar-component-set>'
+                )
+                if path == HOME_PATH:
+                    responses = [self.response(HOME_PATH, "<d:resourcetype><d:collection/></d:resourcetype>")]
+                    if depth != "0":
+                        responses.append(self.response(CALENDAR_PATH, calendar_props))
+                    return self.multistatus(responses)
+                if path == CALENDAR_PATH:
+                    return self.multistatus([self.response(CALENDAR_PATH, calendar_props)])
+                return self.multistatus([self.response(path, "<d:resourcetype><d:collection/></d:resourcetype>")])
+
+            if method == "REPORT":
+                if "sync-collection" in body:
+                    token_match = re.search(r"<[^>]*sync-token[^>]*>([^<]*)<", body)
+                    since = int(token_match.group(1)) if token_match and token_match.group(1).strip().isdigit() else 0
+                    responses = []
+                    for (href, changed_at) in self.changed_at.items():
+                        if changed_at <= since:
+                            continue
+                        if href in self.deleted:
+                            responses.append(f"<d:response><d:href>{href}</d:href><d:status>HTTP/1.1 404 Not Found</d:status></d:response>")
+                        else:
+                            responses.append(self.object_response(href, with_data = False))
+                    return self.multistatus(responses, f"<d:sync-token>{self.sequence}</d:sync-token>")
+
+                if "calendar-multiget" in body:
+                    hrefs = re.findall(r"<[^>]*href>([^<]+)<", body)
+                    return self.multistatus([self.object_response(href, True) for href in hrefs if href in self.objects and href not in self.deleted])
+
+                # calendar-query, optionally limited to a time range
+                range_match = re.search(r'time-range[^>]*start="([^"]+)"[^>]*end="([^"]+)"', body)
+                start = parse_ics_time(range_match.group(1)) if range_match else None
+                end = parse_ics_time(range_match.group(2)) if range_match else None
+                responses = [
+                    self.object_response(href, with_data = True)
+                    for (href, (ics, _)) in self.objects.items()
+                    if href not in self.deleted and self.overlaps(ics, start, end)
+                ]
+                return self.multistatus(responses)
+
+            if method == "GET":
+                if path not in self.objects or path in self.deleted:
+                    return 404, "text/plain", "Not Found", {}
+                ics, etag = self.objects[path]
+                return 200, "text/calendar; charset=utf-8", ics, {"ETag": etag}
+
+            if method == "PUT":
+                self.store(path, body)
+                return 201, "text/plain", "", {"ETag": self.objects[path][1]}
+
+            if method == "DELETE":
+                if path not in self.objects or path in self.deleted:
+                    return 404, "text/plain", "Not Found", {}
+                self.sequence += 1
+                self.changed_at[path] = self.sequence
+                self.deleted.add(path)
+                return 204, "text/plain", "", {}
+
+        return 405, "text/plain", "Method Not Allowed", {}
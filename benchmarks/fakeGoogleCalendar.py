@@ -0,0 +1,233 @@
+import datetime
+import email
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def parse_time(value: str) -> datetime.datetime:
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo = datetime.timezone.utc)
+    return parsed
+
+
+class FakeGoogleCalendar():
+
+    # A small in-memory stand-in for the parts of the Google Calendar v3 API the assistant uses:
+    # events list (paging, sync tokens), get, insert, patch, update, delete, freeBusy and batch requests.
+
+    def __init__(self, port: int = 0, latency: float = 0.01, quota: int | None = None):
+        # seconds every request takes, to stand in for the network round trip
+        self.latency = latency
+        # requests per second that are answered, the ones above it get 429 with Retry-After
+        self.quota = quota
+        self.quota_second: int = 0
+        self.quota_used: int = 0
+        self.throttled: int = 0
+
+        self.lock = threading.Lock()
+        self.events: dict[str, dict] = {}
+        # every change bumps the sequence, sync tokens are the sequence at the time of the listing
+        self.sequence: int = 0
+        self.changed_at: dict[str, int] = {}
+        self.requests: int = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            protocol_version = "HTTP/1.1"
+
+            def handle_any(self):
+                length = int(self.headers.get("Content-Length", "0"))
+                body = self.rfile.read(length) if length > 0 else b""
+                with server.lock:
+                    server.requests += 1
+                time.sleep(server.latency)
+                if server.over_quota():
+                    self.send_throttled()
+                    return
+
+                if self.path.startswith("/batch/"):
+                    status, content_type, payload = server.handle_batch(self.headers.get("Content-Type", ""), body)
+                else:
+                    status, response = server.handle(self.command, self.path, body)
+                    content_type = "application/json"
+                    payload = json.dumps(response).encode("utf-8") if response is not None else b""
+
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_any
+
+            def send_throttled(self):
+                payload = b'{"error": {"code": 429, "message": "Rate Limit Exceeded", "errors": [{"reason": "rateLimitExceeded"}]}}'
+                self.send_response(429)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.send_header("Retry-After", "1")
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.api_endpoint = f"http://127.0.0.1:{self.port}/"
+
+    def over_quota(self) -> bool:
+        if self.quota is None:
+            return False
+        with self.lock:
+            second = int(time.time())
+            if second != self.quota_second:
+                self.quota_second = second
+                self.quota_used = 0
+            self.quota_used += 1
+            if self.quota_used > self.quota:
+                self.throttled += 1
+                return True
+            return False
+
+    def start(self):
+        threading.Thread(target = self.server.serve_forever, daemon = True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_event(self, summary: str, start: str, end: str, **fields) -> dict:
+        with self.lock:
+            return self.store({
+                "kind": "calendar#event",
+                "etag": f'"{uuid.uuid4().hex}"',
+                "id": uuid.uuid4().hex,
+                "status": "confirmed",
+                "htmlLink": "https://www.google.com/calendar/event?eid=benchmark",
+                "summary": summary,
+                "description": fields.get("description", ""),
+                "colorId": fields.get("colorId", "8"),
+                "creator": {"email": "benchmark@example.com", "self": True},
+                "organizer": {"email": "benchmark@example.com", "self": True},
+                "start": {"dateTime": start, "timeZone": "Europe/Berlin"},
+                "end": {"dateTime": end, "timeZone": "Europe/Berlin"},
+                "reminders": {"useDefault": True},
+            })
+
+    def store(self, event: dict) -> dict:
+        self.sequence += 1
+        self.events[event["id"]] = event
+        self.changed_at[event["id"]] = self.sequence
+        return event
+
+    def list_events(self, query: dict) -> dict:
+        items = list(self.events.values())
+        if "syncToken" in query:
+            since = int(query["syncToken"])
+            items = [event for event in items if self.changed_at[event["id"]] > since]
+        else:
+            items = [event for event in items if event["status"] != "cancelled"]
+            if "timeMin" in query:
+                time_min = parse_time(query["timeMin"])
+                items = [event for event in items if parse_time(event["end"]["dateTime"]) > time_min]
+            if "timeMax" in query:
+                time_max = parse_time(query["timeMax"])
+                items = [event for event in items if parse_time(event["start"]["dateTime"]) < time_max]
+        items.sort(key = lambda event: parse_time(event["start"]["dateTime"]))
+
+        offset = int(query.get("pageToken", "0"))
+        page_size = int(query.get("maxResults", "250"))
+        page = items[offset:offset + page_size]
+        result = {"kind": "calendar#events", "items": page}
+        if offset + page_size < len(items):
+            result["nextPageToken"] = str(offset + page_size)
+        elif "orderBy" not in query:
+            # like google, a listing sorted by start cannot be followed by a sync
+            result["nextSyncToken"] = str(self.sequence)
+        return result
+
+    def free_busy(self, request: dict) -> dict:
+        time_min = parse_time(request["timeMin"])
+        time_max = parse_time(request["timeMax"])
+        busy = sorted(
+            (parse_time(event["start"]["dateTime"]), parse_time(event["end"]["dateTime"]))
+            for event in self.events.values()
+            if event["status"] != "cancelled" and event.get("transparency") != "transparent"
+            and parse_time(event["end"]["dateTime"]) > time_min and parse_time(event["start"]["dateTime"]) < time_max
+        )
+        merged = []
+        for (start, end) in busy:
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return {
+            "kind": "calendar#freeBusy",
+            "timeMin": request["timeMin"],
+            "timeMax": request["timeMax"],
+            "calendars": {"primary": {"busy": [{"start": start.isoformat(), "end": end.isoformat()} for (start, end) in merged]}},
+        }
+
+    def handle(self, method: str, path: str, body: bytes) -> tuple[int, dict | None]:
+        url = urlparse(path)
+        query = {key: values[0] for (key, values) in parse_qs(url.query).items()}
+        if url.path == "/calendar/v3/freeBusy" and method == "POST":
+            with self.lock:
+                return 200, self.free_busy(json.loads(body))
+        match = re.fullmatch(r"/calendar/v3/calendars/[^/]+/events(?:/([^/]+))?", url.path)
+        if match is None:
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+        event_id = match.group(1)
+
+        with self.lock:
+            if event_id is None and method == "GET":
+                return 200, self.list_events(query)
+            if event_id is None and method == "POST":
+                event = json.loads(body)
+                event.update({"kind": "calendar#event", "id": uuid.uuid4().hex, "status": "confirmed",
+                              "etag": f'"{uuid.uuid4().hex}"', "htmlLink": "https://www.google.com/calendar/event?eid=benchmark"})
+                return 200, self.store(event)
+
+            if event_id not in self.events or self.events[event_id]["status"] == "cancelled":
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            if method == "GET":
+                return 200, self.events[event_id]
+            if method == "DELETE":
+                self.store({**self.events[event_id], "status": "cancelled"})
+                return 204, None
+            if method == "PATCH":
+                return 200, self.store({**self.events[event_id], **json.loads(body)})
+            if method == "PUT":
+                return 200, self.store({**json.loads(body), "id": event_id, "status": "confirmed"})
+        return 405, {"error": {"code": 405, "message": "Method Not Allowed"}}
+
+    def handle_batch(self, content_type: str, body: bytes) -> tuple[int, str, bytes]:
+        message = email.message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + body)
+        response_boundary = uuid.uuid4().hex
+        parts = []
+        for part in message.get_payload():
+            content_id = part["Content-ID"].strip("<>")
+            request = part.get_payload()
+
+            # the inner request is a plain HTTP message: request line, headers, blank line, body
+            head, _, request_body = request.replace("\r\n", "\n").partition("\n\n")
+            method, path, _ = head.splitlines()[0].split(" ", 2)
+            status, response = self.handle(method, path, request_body.strip().encode("utf-8"))
+
+            payload = json.dumps(response) if response is not None else ""
+            parts.append(
+                f"--{response_boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n{payload}\r\n"
+            )
+        payload = ("".join(parts) + f"--{response_boundary}--\r\n").encode("utf-8")
+        return 200, f"multipart/mixed; boundary={response_boundary}", payload
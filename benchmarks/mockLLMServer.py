@@ -0,0 +1,112 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ScriptedModel():
+
+    # Answers like the assistant model would, but decides from simple rules on the request:
+    # the manager hands off, a calendar manager calls a tool for a fresh user statement and
+    # answers with plain text once it has seen the tool result.
+
+    def __init__(self, week_start: str = "2025-01-06T00:00:00"):
+        self.week_start = week_start
+
+    def is_tool_result(self, messages: list[dict]) -> bool:
+        # a user message right after an assistant tool call carries the result of that call
+        if len(messages) < 2 or messages[-2]["role"] != "assistant":
+            return False
+        return messages[-2]["content"].lstrip().startswith(("[", "{"))
+
+    def respond(self, messages: list[dict], tools: list[dict]) -> str:
+        tool_names = {tool["function"]["name"] for tool in tools}
+        statement = messages[-1]["content"]
+
+        if self.is_tool_result(messages):
+            return f"Here is what I found: {statement[:120]}"
+
+        if "assign_task_to" in tool_names:
+            if re.search(r"next ?cloud", statement, re.IGNORECASE):
+                return json.dumps([{"name": "assign_task_to", "arguments": {"target": "Nextcloud"}}])
+            if re.search(r"google|calendar|meeting|event", statement, re.IGNORECASE):
+                return json.dumps([{"name": "assign_task_to", "arguments": {"target": "Google"}}])
+            return "Hello! How can I help you with your calendars?"
+
+        if re.search(r"\b(add|create|put|book)\b", statement, re.IGNORECASE):
+            return json.dumps([{"name": "put_event", "arguments": {
+                "summary": "Benchmark event",
+                "time_from": "2025-01-08T18:00:00",
+                "time_till": "2025-01-08T19:00:00",
+            }}])
+        if re.search(r"\b(both|two weeks|compare)\b", statement, re.IGNORECASE):
+            return json.dumps([
+                {"name": "get_events", "arguments": {"time_from": self.week_start, "time_till": "2025-01-13T00:00:00"}},
+                {"name": "get_events", "arguments": {"time_from": "2025-01-13T00:00:00", "time_till": "2025-01-20T00:00:00"}},
+            ])
+        if re.search(r"\b(what|show|list|events?|schedule|week)\b", statement, re.IGNORECASE):
+            return json.dumps([{"name": "get_events", "arguments": {"time_from": self.week_start, "time_till": "2025-01-13T00:00:00"}}])
+        return "Is there anything else I can do for you?"
+
+
+class MockLLMServer():
+
+    def __init__(self, port: int = 0, latency: float = 0.05, model: ScriptedModel | None = None):
+        # seconds every completion takes, to stand in for generation time
+        self.latency = latency
+        self.model = model if model is not None else ScriptedModel()
+
+        self.lock = threading.Lock()
+        self.calls: int = 0
+        self.bytes_received: int = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                request = json.loads(body)
+                with server.lock:
+                    server.calls += 1
+                    server.bytes_received += len(body)
+                time.sleep(server.latency)
+
+                content = server.model.respond(request["messages"], request["tools"])
+                if request.get("stream"):
+                    # one JSON object per line, a few words at a time
+                    words = re.findall(r"\S+\s*", content)
+                    lines = [json.dumps({"response": {"content": "".join(words[index:index + 3])}}) for index in range(0, len(words), 3)]
+                    lines.append(json.dumps({"response": {"content": ""}, "done": True}))
+                    payload = ("\n".join(lines) + "\n").encode("utf-8")
+                    content_type = "application/x-ndjson"
+                else:
+                    payload = json.dumps({"response": {"role": "assistant", "content": content}}).encode("utf-8")
+                    content_type = "application/json"
+
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def start(self):
+        threading.Thread(target = self.server.serve_forever, daemon = True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def snapshot(self) -> tuple[int, int]:
+        with self.lock:
+            return self.calls, self.bytes_received
@@ -0,0 +1,203 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from google.oauth2.credentials import Credentials
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import LLMAssistant
+from assistants.backendRegistry import BackendRegistry
+from assistants.tracing import Tracer
+from assistants.calenderManager.googleCalendar import GoogleCalendar
+from assistants.calenderManager.nextcloudCalendar import NextcloudCalendar
+from benchmarks.mockLLMServer import MockLLMServer
+from benchmarks.fakeGoogleCalendar import FakeGoogleCalendar
+from benchmarks.fakeCalDAVServer import FakeCalDAVServer
+
+
+# every dialogue is a list of user statements that are sent one after the other
+DIALOGUES = [
+    [
+        "Hello there",
+        "What is on my google calendar this week?",
+        "Please add a rehearsal to my google calendar",
+        "Show me this week again",
+        "Thanks, that's all",
+    ],
+    [
+        "What is on my nextcloud calendar this week?",
+        "Compare both weeks on nextcloud",
+        "Add a dinner to my nextcloud calendar",
+        "Thanks",
+    ],
+]
+
+
+class TurnRecorder():
+
+    # counts the LLM calls and request bytes of the turn running on the current thread
+
+    def __init__(self, assistant: LLMAssistant):
+        self.local = threading.local()
+        get_response = assistant.llm_client.get_response
+
+        def counting_get_response(messages, tools):
+            self.local.calls = getattr(self.local, "calls", 0) + 1
+            self.local.bytes = getattr(self.local, "bytes", 0) + len(json.dumps({"messages": messages, "tools": tools}))
+            return get_response(messages, tools)
+
+        assistant.llm_client.get_response = counting_get_response
+
+    def reset(self):
+        self.local.calls = 0
+        self.local.bytes = 0
+
+    def read(self) -> tuple[int, int]:
+        return self.local.calls, self.local.bytes
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    if len(ordered) == 0:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def seed_calendars(google: FakeGoogleCalendar, caldav: FakeCalDAVServer, events_per_day: int):
+    for day in range(1, 29):
+        for slot in range(events_per_day):
+            hour = 8 + slot
+            google.add_event(f"Google event {day}-{slot}", f"2025-01-{day:02d}T{hour:02d}:00:00+00:00", f"2025-01-{day:02d}T{hour:02d}:45:00+00:00",
+                             description = "Seeded for the benchmark " * 4)
+            caldav.add_event(f"Nextcloud event {day}-{slot}", f"202501{day:02d}T{hour:02d}0000Z", f"202501{day:02d}T{hour:02d}4500Z")
+
+
+def create_assistant(llm: MockLLMServer, google: FakeGoogleCalendar, caldav: FakeCalDAVServer, use_cache: bool, trace_path: str | None = None) -> LLMAssistant:
+    tracer = Tracer(enabled = trace_path is not None, trace_path = trace_path)
+    assistant = LLMAssistant(port = str(llm.port), pool_size = 64, tracer = tracer)
+    creds = Credentials(token = "benchmark")
+
+    # the real backends, pointed at the local stand-ins
+    assistant.backends = BackendRegistry()
+    def create_google() -> GoogleCalendar:
+        backend = GoogleCalendar(use_cache = use_cache, creds = creds, api_endpoint = google.api_endpoint)
+        # the local copy is laid around the seeded weeks
+        backend.sync_anchor = lambda: datetime.date(2025, 1, 6)
+        return backend
+
+    assistant.backends.register("Google", create_google)
+    assistant.backends.register("Nextcloud", lambda: NextcloudCalendar(use_cache = use_cache, url = caldav.url, credentials = caldav.credentials))
+    assistant.manager.backends = assistant.backends
+    # the scripted model asks for the seeded week, the prefetcher has to guess around the same days
+    assistant.today = lambda: datetime.date(2025, 1, 6)
+    return assistant
+
+
+def run_session(assistant: LLMAssistant, recorder: TurnRecorder, session_id: str, dialogue: list[str]) -> list[dict]:
+    turns = []
+    for statement in dialogue:
+        recorder.reset()
+        started = time.perf_counter()
+        # like the dialogue server, every turn takes the session from the store
+        session = assistant.sessions.get(session_id)
+        assistant.run_turn(session, statement)
+        latency = time.perf_counter() - started
+        calls, sent = recorder.read()
+        turns.append({"latency": latency, "llm_calls": calls, "bytes_sent": sent})
+    assistant.sessions.remove(session_id)
+    return turns
+
+
+def run_benchmark(sessions: int, rounds: int, llm_latency: float, calendar_latency: float, events_per_day: int, use_cache: bool, trace_path: str | None = None, quota: int | None = None) -> dict:
+
+    llm = MockLLMServer(latency = llm_latency)
+    google = FakeGoogleCalendar(latency = calendar_latency, quota = quota)
+    caldav = FakeCalDAVServer(latency = calendar_latency, quota = quota)
+    for server in (llm, google, caldav):
+        server.start()
+    seed_calendars(google, caldav, events_per_day)
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            assistant = create_assistant(llm, google, caldav, use_cache, trace_path)
+            recorder = TurnRecorder(assistant)
+
+            tracemalloc.start()
+            started = time.perf_counter()
+            jobs = [
+                (f"session-{round_index}-{index}", DIALOGUES[index % len(DIALOGUES)])
+                for round_index in range(rounds)
+                for index in range(sessions)
+            ]
+            # every worker plays one user, so `sessions` conversations run at the same time
+            with ThreadPoolExecutor(max_workers = sessions) as executor:
+                results = list(executor.map(lambda job: run_session(assistant, recorder, *job), jobs))
+            duration = time.perf_counter() - started
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            prefetched = [assistant.backends.get(name).prefetched for name in assistant.backends.names() if assistant.backends.is_loaded(name)]
+    finally:
+        for server in (llm, google, caldav):
+            server.stop()
+
+    turns = [turn for session_turns in results for turn in session_turns]
+    latencies = [turn["latency"] for turn in turns]
+    return {
+        "sessions": sessions,
+        "rounds": rounds,
+        "turns": len(turns),
+        "duration_s": round(duration, 3),
+        "turns_per_s": round(len(turns) / duration, 2),
+        "latency_p50_ms": round(1000 * percentile(latencies, 0.50), 1),
+        "latency_p95_ms": round(1000 * percentile(latencies, 0.95), 1),
+        "latency_p99_ms": round(1000 * percentile(latencies, 0.99), 1),
+        "llm_calls_per_turn": round(sum(turn["llm_calls"] for turn in turns) / len(turns), 2),
+        "bytes_sent_per_turn": round(sum(turn["bytes_sent"] for turn in turns) / len(turns)),
+        "google_requests": google.requests,
+        "caldav_requests": caldav.requests,
+        "google_throttled": google.throttled,
+        "caldav_throttled": caldav.throttled,
+        "prefetch_hits": sum(cache.hits for cache in prefetched),
+        "prefetch_misses": sum(cache.misses for cache in prefetched),
+        "peak_memory_kb": round(peak_memory / 1024),
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = "Drives LLMAssistant through scripted dialogues against local stand-ins.")
+    parser.add_argument("--sessions", type = int, default = 1, help = "number of conversations running at the same time")
+    parser.add_argument("--rounds", type = int, default = 5, help = "number of dialogues every simulated user plays")
+    parser.add_argument("--llm-latency", type = float, default = 0.05)
+    parser.add_argument("--calendar-latency", type = float, default = 0.01)
+    parser.add_argument("--events-per-day", type = int, default = 4)
+    parser.add_argument("--no-cache", action = "store_true", help = "read the calendars remotely instead of through the event cache")
+    parser.add_argument("--quota", type = int, default = None, help = "requests per second the calendar stand-ins answer before they send 429")
+    parser.add_argument("--trace-file", default = None, help = "append the spans of every turn to this file as JSON lines")
+    parser.add_argument("--json", action = "store_true", help = "print the report as one JSON object")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        sessions = args.sessions,
+        rounds = args.rounds,
+        llm_latency = args.llm_latency,
+        calendar_latency = args.calendar_latency,
+        events_per_day = args.events_per_day,
+        use_cache = not args.no_cache,
+        trace_path = args.trace_file,
+        quota = args.quota,
+    )
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for (key, value) in report.items():
+            print(f"{key:>22}: {value}")
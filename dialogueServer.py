@@ -0,0 +1,152 @@
+import argparse
+import asyncio
+import json
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from assistants.sessionStore import SessionStore
+from assistants.conversationJournal import ConversationJournal
+from assistants.tracing import Tracer
+from main import LLMAssistant
+
+# POST /dialogue/<session_id>  (POST /dialogue starts a new session)
+# GET /metrics  (prometheus text format, empty unless tracing is enabled)
+# receiving from Dialogue
+# {
+#   statement: string,
+#   endConversation: Boolean,
+# }
+# sending back to dialogue
+# {
+#   sessionId: string,
+#   message: string,
+#   endConversation: Boolean,
+# }
+
+class DialogueServer():
+
+    def __init__(self, assistant: LLMAssistant, host: str = "127.0.0.1", port: int = 8450, max_workers: int = 32):
+
+        self.assistant = assistant
+        self.host = host
+        self.port = port
+
+        # LLM and calendar calls block, so turns run on worker threads and never stall the event loop
+        self.executor = ThreadPoolExecutor(max_workers = max_workers)
+
+        # turns of the same session are handled one after the other, a lock lives as long as someone waits on it
+        self.session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def get_lock(self, session_id: str) -> asyncio.Lock:
+        lock = self.session_locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self.session_locks[session_id] = lock
+        return lock
+
+    def end_session(self, session_id: str):
+        self.assistant.sessions.remove(session_id)
+
+    async def handle_dialogue(self, session_id: str, request: dict) -> dict:
+
+        if request.get("endConversation", False):
+            self.end_session(session_id)
+            return {"sessionId": session_id, "message": "", "endConversation": True}
+
+        async with self.get_lock(session_id):
+            loop = asyncio.get_running_loop()
+            # the session store may read a spilled session from disk, so it is asked on a worker thread too
+            session = await loop.run_in_executor(self.executor, self.assistant.sessions.get, session_id)
+            answer = await loop.run_in_executor(self.executor, self.assistant.run_turn, session, request["statement"])
+
+        end_conversation = not session.is_alive
+        if end_conversation:
+            self.end_session(session_id)
+        return {"sessionId": session_id, "message": answer, "endConversation": end_conversation}
+
+    async def handle_request(self, method: str, path: str, body: bytes) -> tuple[int, dict | bytes]:
+
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        if method == "GET" and parts == ["metrics"]:
+            return 200, self.assistant.tracer.render_metrics()
+        if method != "POST" or len(parts) not in (1, 2) or parts[0] != "dialogue":
+            return 404, {"error": "not found"}
+
+        try:
+            request = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            return 400, {"error": "the body has to be JSON"}
+        if "statement" not in request and not request.get("endConversation", False):
+            return 400, {"error": "statement is missing"}
+
+        session_id = parts[1] if len(parts) == 2 else uuid.uuid4().hex
+        try:
+            return 200, await self.handle_dialogue(session_id, request)
+        except Exception as error:
+            print(f"Session {session_id} failed: {error}")
+            return 500, {"error": str(error)}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # one connection can carry several requests as long as the client keeps it alive
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                status, response = await self.handle_request(method, path, body)
+
+                keep_alive = headers.get("connection", "keep-alive").lower() != "close"
+                if isinstance(response, bytes):
+                    payload, content_type = response, "text/plain; version=0.0.4; charset=utf-8"
+                else:
+                    payload, content_type = json.dumps(response).encode("utf-8"), "application/json"
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        print(f"Dialogue server listening on http://{self.host}:{self.port}/dialogue")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8450)
+    parser.add_argument("--model-port", default = "8440")
+    parser.add_argument("--workers", type = int, default = 32)
+    parser.add_argument("--session-dir", default = None)
+    parser.add_argument("--journal-dir", default = None, help = "log every turn here and restore sessions from it after a restart")
+    parser.add_argument("--trace", action = "store_true", help = "record spans of every turn and export them on /metrics")
+    parser.add_argument("--trace-file", default = None, help = "append every traced turn to this file as one JSON line")
+    args = parser.parse_args()
+
+    journal = ConversationJournal(args.journal_dir) if args.journal_dir is not None else None
+    tracer = Tracer(enabled = args.trace or args.trace_file is not None, trace_path = args.trace_file)
+    assistant = LLMAssistant(port = args.model_port, pool_size = args.workers, warm_up = True, session_store = SessionStore(spill_directory = args.session_dir, journal = journal), tracer = tracer)
+    server = DialogueServer(assistant, host = args.host, port = args.port, max_workers = args.workers)
+    asyncio.run(server.serve())
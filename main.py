@@ -1,8 +1,22 @@
+import argparse
 import json
-import requests
+import contextvars
+import datetime
+from concurrent.futures import ThreadPoolExecutor
 from assistants.functionManager import FunctionManager
-from assistants.calenderManager.googleCalendar import GoogleCalendar
+from assistants.managerStructure import ManagerStructure, ManagerState
+from assistants.backendRegistry import BackendRegistry
+from assistants.dialogueSession import DialogueSession
+from assistants.sessionStore import SessionStore
+from assistants.taskRouter import TaskRouter
+from assistants.llmClient import LLMClient
+from assistants.streamParser import ToolCallDetector
+from assistants.toolCallParser import parse_tool_calls
+from assistants.contextWindow import estimate_tokens
+from assistants.tracing import Tracer, get_tracer, set_tracer
+from assistants.calenderManager.googleCalendar import GoogleCalendar, has_saved_login
 from assistants.calenderManager.nextcloudCalendar import NextcloudCalendar
+from assistants.calenderManager.prefetch import mentioned_days, prefetch_window
 
 # receiving from Dialogue
 # {
@@ -17,77 +31,291 @@ from assistants.calenderManager.nextcloudCalendar import NextcloudCalendar
 
 class LLMAssistant():
 
-    def __init__(self, port: str = "8440"):
+    def __init__(self, port: str = "8440", pool_size: int = 10, timeout: float = 120.0, max_retries: int = 3, stream: bool = False, warm_up: bool = False, session_store: SessionStore | None = None, max_tool_workers: int = 8, tracer: Tracer | None = None):
 
         self.model_URL = f"http://localhost:{port}/api/prompt"
+        self.llm_client: LLMClient = LLMClient(
+            self.model_URL,
+            pool_size = pool_size,
+            read_timeout = timeout,
+            max_retries = max_retries,
+        )
+
+        # the calendar backends are only created once a task is assigned to them and are shared by all sessions
+        self.backends: BackendRegistry = BackendRegistry()
+        self.backends.register("Google", GoogleCalendar, can_start_unattended = has_saved_login)
+        self.backends.register("Nextcloud", NextcloudCalendar)
+        if warm_up:
+            self.backends.warm_up()
+
+        self.manager: FunctionManager = FunctionManager(self.backends)
+
+        # sends obvious requests straight to a backend without asking the manager LLM first
+        self.router: TaskRouter = TaskRouter()
+
+        # tool calls of one completion that only read run side by side on this pool
+        self.tool_executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers = max_tool_workers)
+
+        # the state of every conversation lives here instead of on the managers
+        self.sessions: SessionStore = session_store if session_store is not None else SessionStore()
 
-        self.google_calendar: GoogleCalendar = GoogleCalendar()
-        self.nextcloud_calendar: NextcloudCalendar = NextcloudCalendar()
-        self.manager: FunctionManager = FunctionManager()
+        # the day the prefetched reads are chosen around
+        self.today = datetime.date.today
 
-        self.history: list[dict[str,str]] = []
+        # whether completions are streamed and plain text answers are printed while they arrive
+        self.stream: bool = stream
+
+        # records spans of every turn, disabled unless a tracer is passed
+        if tracer is not None:
+            set_tracer(tracer)
+        self.tracer: Tracer = get_tracer()
+
+    def measure_prompt(self, span, messages):
+        # only paid for while tracing is enabled
+        if self.tracer.enabled:
+            payload = json.dumps(messages)
+            span.set(messages = len(messages), bytes = len(payload.encode("utf-8")), tokens = estimate_tokens(payload))
 
     def get_LLM_response(self, messages, tools) -> str:
+        with self.tracer.span("llm", "completion") as span:
+            self.measure_prompt(span, messages)
+            return self.llm_client.get_response(messages, tools)
+
+    async def get_LLM_response_async(self, messages, tools) -> str:
+        with self.tracer.span("llm", "completion") as span:
+            self.measure_prompt(span, messages)
+            return await self.llm_client.get_response_async(messages, tools)
+
+    def get_LLM_response_streaming(self, messages, tools) -> tuple[str, bool]:
+        with self.tracer.span("llm", "stream") as span:
+            self.measure_prompt(span, messages)
+            return self.read_streamed_response(messages, tools)
+
+    def print_streamed(self, text: str, printed: bool) -> bool:
+        # returns whether anything of the answer has been printed so far
+        if not printed:
+            text = text.lstrip()
+            if text == "":
+                return False
+            print("[ASSISTANT]: " + text, end = "", flush = True)
+        else:
+            print(text, end = "", flush = True)
+        return True
+
+    def read_streamed_response(self, messages, tools) -> tuple[str, bool]:
+        # returns the completion and whether it was printed to the user, kept per call since turns of several sessions run at once
+
+        detector = ToolCallDetector(spec["function"]["name"] for spec in tools)
+        printed = False
+        for delta in self.llm_client.stream_response(messages, tools):
+            mode = detector.feed(delta)
+            if mode == "text":
+                printed = self.print_streamed(detector.take_printable(), printed)
+            elif mode == "tool_call" and detector.is_complete:
+                # the tool call is closed, so there is no need to wait for the rest of the generation
+                return detector.get_tool_call(), False
+
+        if detector.mode == "text":
+            # text that could have been a call is only shown once parse_tool_calls ruled that out
+            rest = detector.finish()
+            if rest is not None:
+                printed = self.print_streamed(rest, printed)
+            elif printed:
+                # a call or an unreadable one after some prose, the answer is printed whole if it ends up being taken as one
+                print()
+                printed = False
+        if printed:
+            print()
+        return detector.buffer, printed
+
+
+    def get_manager(self, name: str) -> ManagerStructure:
+        if name == "Manager":
+            return self.manager
+        return self.backends.get(name)
+
+    def call_tool(self, active_manager: ManagerStructure, call: dict, state: ManagerState) -> str:
+        with self.tracer.span("tool", call["name"]):
+            return active_manager.handle_function_call(call["name"], call["arguments"], state)
+
+    def dispatch_tool_calls(self, active_manager: ManagerStructure, calls: list[dict], state: ManagerState) -> str:
+
+        results: list[str] = [""] * len(calls)
+        pending = []
+
+        def wait_for_pending():
+            for (index, future) in pending:
+                results[index] = future.result()
+            pending.clear()
+
+        for (index, call) in enumerate(calls):
+            if len(calls) > 1 and call["name"] in active_manager.read_only_tools:
+                # the copied context carries the current turn over to the worker thread
+                pending.append((index, self.tool_executor.submit(contextvars.copy_context().run, self.call_tool, active_manager, call, state)))
+            else:
+                # a call that changes something waits for the reads before it and runs on its own
+                wait_for_pending()
+                results[index] = self.call_tool(active_manager, call, state)
+        wait_for_pending()
 
-        response = requests.post(
-            url = self.model_URL, 
-            json = {"messages": messages, "tools": tools}, 
-            headers = {"accept": "application/json", "Content-Type": "application/json"}
+        if len(calls) == 1:
+            return results[0]
+        # all results go back to the model together in one message
+        return "\n".join(
+            f"Result of {call['name']}({json.dumps(call['arguments'])}): {result}"
+            for (call, result) in zip(calls, results) if result
         )
-        decoded_output = response.json()["response"]["content"]
-        
-        return decoded_output
 
+    def route_request(self, session: DialogueSession, user_input: str):
 
-    def manager_conversation_loop(self):
+        target, confidence = self.router.route(user_input, session.routed_to)
+        if target is None or target == session.active_manager:
+            return
+        if session.active_manager != "Manager" and confidence < self.router.switch_threshold:
+            # a backend is only left when the user names another one
+            return
+        try:
+            self.get_manager(target)
+        except Exception:
+            # an unavailable backend is left to the manager, which can explain it to the user
+            return
+        print(f"    Routing directly to {target} ({confidence:.2f})")
+        session.active_manager = target
+        session.routed_to = target
 
-        active_manager = self.manager
-        while active_manager.is_alive:
-            
-            user_input = input("[USER]: ")
-            active_manager.push_user_message(user_input)
-            active_manager.unstatisfy()
+    def prefetch(self, target: str, user_input: str, handoff: bool = False):
+        # starts the reads the next completion will most likely ask for while it is still being generated:
+        # after a handoff the week around today, and the weeks of the days the user names
+        days = mentioned_days(user_input, self.today())
+        if handoff:
+            days.insert(0, self.today())
+        if len(days) == 0:
+            return
+        if target == "Manager":
+            # get_all_events reads every calendar that is running
+            names = [name for name in self.backends.names() if self.backends.is_loaded(name)]
+        else:
+            names = [target]
+        for name in names:
+            backend = self.backends.get(name)
+            for day in days:
+                backend.prefetch_events(*prefetch_window(day))
 
-            while not active_manager.is_statisfied:
+    def run_turn(self, session: DialogueSession, user_input: str) -> str:
+        answer, _ = self.run_turn_printed(session, user_input)
+        return answer
 
-                # print("getting a response from llm with following messages:")
-                # for message in active_manager.messages:
-                #     print(f"    [{message["role"].swapcase()}]: {message["content"]}")
-                raw_response = self.get_LLM_response(active_manager.messages, active_manager.tools)
-                active_manager.push_assistant_message(raw_response)
-                self.history.append(active_manager.messages[-1])
+    def run_turn_printed(self, session: DialogueSession, user_input: str) -> tuple[str, bool]:
+        # also returns whether the answer was already printed while it streamed
+        with self.tracer.turn(session.session_id):
+            try:
+                return self.handle_turn(session, user_input)
+            except BaseException:
+                # a finished turn is released by record_turn, a failed one has to unpin its session here
+                self.sessions.release(session)
+                raise
 
-                try:
-                    response = json.loads(raw_response)
-                    response = response[0]
-                    called_function = response["name"]
-                    function_response = active_manager.handle_function_call(called_function, response["arguments"])
-
-                    assigned_task_to = active_manager.assigned_task_to
-                    active_manager.assigned_task_to = "None"
-                    if assigned_task_to != "None":
-                        if assigned_task_to == "Manager":
-                            active_manager = self.manager
-                        elif assigned_task_to == "Google":
-                            active_manager = self.google_calendar
-                        elif assigned_task_to == "Nextcloud":
-                            active_manager = self.nextcloud_calendar
-
-                        print(f"    Switching assistant to {assigned_task_to}")
-                        active_manager.push_user_message(user_input)
-                        active_manager.unstatisfy()
-                    else:
-                        active_manager.push_user_message(function_response)
+    def handle_turn(self, session: DialogueSession, user_input: str) -> tuple[str, bool]:
+
+        previous_manager = session.active_manager
+        self.route_request(session, user_input)
+
+        active_manager = self.get_manager(session.active_manager)
+        # routing straight to a backend is a handoff as well
+        self.prefetch(session.active_manager, user_input, handoff = session.active_manager != previous_manager)
+        state = session.get_state(session.active_manager, active_manager)
+        state.push_user_message(user_input)
+        state.unstatisfy()
+        # whether the last completion was printed while it streamed
+        printed = False
+        # a completion that cannot be read is asked for again once per turn, then taken as the answer
+        asked_again = False
+
+        while not state.is_statisfied:
+
+            if self.stream:
+                raw_response, printed = self.get_LLM_response_streaming(state.messages, active_manager.tools)
+            else:
+                raw_response = self.get_LLM_response(state.messages, active_manager.tools)
+
+            parsed = parse_tool_calls(raw_response, active_manager.tool_specs.keys())
+            if parsed.kind == "malformed" and not asked_again:
+                asked_again = True
+                self.tracer.record_error(ValueError(parsed.error))
+                state.push_assistant_message(raw_response)
+                state.push_function_response(
+                    f"Your last message looked like a function call but could not be read: {parsed.error}. "
+                    'Answer again with only the function call as JSON, e.g. [{"name": "...", "arguments": {...}}], or with plain text if you did not want to call a function.'
+                )
+                continue
+            if parsed.kind != "tool_calls":
+                state.push_assistant_message(raw_response)
+                session.add_history(state.messages[-1])
+                state.statisfy()
+                break
+
+            # the history keeps the clean call, not the prose or code fence around it
+            state.push_assistant_message(json.dumps(parsed.calls, ensure_ascii = False))
+            session.add_history(state.messages[-1])
 
+            try:
+                function_response = self.dispatch_tool_calls(active_manager, parsed.calls, state)
+            except Exception as error:
+                # the tools report their own failures, this is only reached by bugs, which the model can still apologize for
+                self.tracer.record_error(error)
+                state.assigned_task_to = "None"
+                state.push_function_response(f"The function call failed because of {error}. Excuse yourself in front of the user.")
+                continue
+
+            assigned_task_to = state.assigned_task_to
+            state.assigned_task_to = "None"
+            if assigned_task_to != "None":
+                try:
+                    next_manager = self.get_manager(assigned_task_to)
                 except Exception as error:
-                    active_manager.statisfy()
+                    state.push_function_response(f"The {assigned_task_to} assistant is not available right now because of {error}. Tell the user about it.")
+                    continue
+
+                active_manager = next_manager
+                session.active_manager = assigned_task_to
+                if assigned_task_to != "Manager":
+                    session.routed_to = assigned_task_to
+                state = session.get_state(assigned_task_to, active_manager)
+                print(f"    Switching assistant to {assigned_task_to}")
+                self.tracer.count_handoff()
+                self.prefetch(assigned_task_to, user_input, handoff = assigned_task_to != "Manager")
+                state.push_user_message(user_input)
+                state.unstatisfy()
+            else:
+                state.push_function_response(function_response)
+
+        self.sessions.record_turn(session)
+        return state.messages[-1]["content"], printed
+
+    def manager_conversation_loop(self):
 
-            print(f"[{active_manager.messages[-1]["role"].swapcase()}]: {active_manager.messages[-1]["content"]}")
+        is_alive = True
+        while is_alive:
+            
+            user_input = input("[USER]: ")
+            # taken from the store every turn, which keeps it pinned until the turn is recorded
+            session = self.sessions.get("local")
+            answer, printed = self.run_turn_printed(session, user_input)
+            is_alive = session.is_alive
+
+            if printed:
+                continue
+            print(f"[ASSISTANT]: {answer}")
 
 
 
                
 if __name__ == "__main__":
 
-    my_assistant = LLMAssistant()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream", action = "store_true", help = "print plain text answers while the model generates them")
+    args = parser.parse_args()
+
+    # the calendars start while the user types, a google login is only opened once a task needs it
+    my_assistant = LLMAssistant(stream = args.stream, warm_up = True)
     my_assistant.manager_conversation_loop()
\ No newline at end of file
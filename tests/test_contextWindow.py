@@ -0,0 +1,60 @@
+from assistants.contextWindow import ContextWindow
+
+
+def turn(number: int, result_size: int = 200) -> list[tuple[dict, bool]]:
+    return [
+        ({"role": "user", "content": f"question {number}"}, False),
+        ({"role": "assistant", "content": "[call]"}, False),
+        ({"role": "user", "content": "r" * result_size}, True),
+        ({"role": "assistant", "content": f"answer {number}"}, False),
+    ]
+
+
+def add_turn(window: ContextWindow, number: int, result_size: int = 200):
+    for (message, is_tool_result) in turn(number, result_size):
+        window.append(message, is_tool_result = is_tool_result)
+
+
+def test_window_keeps_whole_turns():
+    window = ContextWindow(token_budget = 200, keep_recent = 4, tool_result_limit = 100)
+    window.append({"role": "system", "content": "prompt"})
+    for number in range(10):
+        for (message, is_tool_result) in turn(number):
+            window.append(message, is_tool_result = is_tool_result)
+            messages = window.messages
+            assert messages[0]["role"] == "system"
+            # after the system prompt the window always starts with a question of the user
+            assert messages[1]["content"].startswith("question")
+            # every tool call still has the question that caused it
+            for index in range(1, len(messages)):
+                if messages[index]["content"] == "[call]":
+                    assert messages[index - 1]["content"].startswith("question")
+
+
+def test_turns_are_dropped_oldest_first():
+    window = ContextWindow(token_budget = 200, keep_recent = 4, tool_result_limit = 100)
+    for number in range(5):
+        add_turn(window, number, result_size = 100)
+    contents = [message["content"] for message in window.messages]
+    assert contents[0].startswith("question")
+    assert contents[-1] == "answer 4"
+    numbers = [int(content.split()[1]) for content in contents if content.startswith("question")]
+    assert numbers == sorted(numbers) and numbers[-1] == 4
+
+
+def test_large_recent_tool_result_is_shortened():
+    window = ContextWindow(token_budget = 500, keep_recent = 6, tool_result_limit = 400)
+    window.append({"role": "system", "content": "prompt"})
+    window.append({"role": "user", "content": "question"})
+    window.append({"role": "assistant", "content": "[call]"})
+    window.append({"role": "user", "content": "x" * 8000}, is_tool_result = True)
+    assert window.total_tokens <= window.token_budget
+    assert [message["content"][:8] for message in window.messages[:3]] == ["prompt", "question", "[call]"]
+    assert window.messages[-1]["content"].endswith("[tool result shortened to fit the context window]")
+
+
+def test_reset_counts_tokens():
+    window = ContextWindow(token_budget = 1000)
+    window.reset([{"role": "system", "content": "prompt"}, {"role": "user", "content": "hello"}])
+    assert window.total_tokens == sum(window.token_counts)
+    assert len(window.messages) == 2
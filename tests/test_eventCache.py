@@ -0,0 +1,31 @@
+import datetime
+
+from assistants.calenderManager.eventCache import EventCache
+
+
+def test_query_returns_overlapping_events():
+    cache = EventCache()
+    cache.upsert("a", "2025-01-06T09:00:00+00:00", "2025-01-06T10:00:00+00:00", "a")
+    cache.upsert("b", "2025-01-06T11:00:00+00:00", "2025-01-06T12:00:00+00:00", "b")
+    cache.upsert("week", "2025-01-01T00:00:00+00:00", "2025-01-08T00:00:00+00:00", "week")
+    assert sorted(cache.query("2025-01-06T09:30:00+00:00", "2025-01-06T11:30:00+00:00")) == ["a", "b", "week"]
+    assert cache.query("2025-01-06T10:00:00+00:00", "2025-01-06T11:00:00+00:00") == ["week"]
+
+
+def test_max_duration_shrinks_after_remove():
+    cache = EventCache()
+    cache.upsert("a", "2025-01-06T09:00:00+00:00", "2025-01-06T10:00:00+00:00", "a")
+    cache.upsert("week", "2025-01-01T00:00:00+00:00", "2025-01-08T00:00:00+00:00", "week")
+    assert cache.max_duration == datetime.timedelta(days = 7)
+    cache.remove("week")
+    assert cache.max_duration == datetime.timedelta(hours = 1)
+    assert cache.query("2025-01-06T09:30:00+00:00", "2025-01-06T09:45:00+00:00") == ["a"]
+
+
+def test_max_duration_follows_shortened_event():
+    cache = EventCache()
+    cache.upsert("a", "2025-01-06T09:00:00+00:00", "2025-01-07T09:00:00+00:00", "a")
+    cache.upsert("a", "2025-01-06T09:00:00+00:00", "2025-01-06T09:30:00+00:00", "a")
+    assert cache.max_duration == datetime.timedelta(minutes = 30)
+    cache.remove("a")
+    assert cache.max_duration == datetime.timedelta(0)
@@ -0,0 +1,67 @@
+import datetime
+from assistants.calenderManager.freeBusy import DEFAULT_ZONE, format_slots, free_slots, intersect, merge_intervals, parse_clock, parse_query_time
+
+UTC = datetime.timezone.utc
+CET = datetime.timezone(datetime.timedelta(hours = 1))
+
+
+def at(hour: int, minute: int = 0, day: int = 6, zone: datetime.tzinfo = UTC) -> datetime.datetime:
+    return datetime.datetime(2025, 1, day, hour, minute, tzinfo = zone)
+
+
+def test_merge_intervals():
+    intervals = [(at(12), at(13)), (at(9), at(10)), (at(9, 30), at(11)), (at(11), at(11, 30))]
+    assert merge_intervals(intervals) == [(at(9), at(11, 30)), (at(12), at(13))]
+    assert merge_intervals([]) == []
+
+
+def test_merge_intervals_keeps_contained_end():
+    assert merge_intervals([(at(9), at(12)), (at(10), at(11))]) == [(at(9), at(12))]
+
+
+def test_intersect():
+    first = [(at(8), at(10)), (at(11), at(15))]
+    second = [(at(9), at(12)), (at(14), at(16))]
+    assert intersect(first, second) == [(at(9), at(10)), (at(11), at(12)), (at(14), at(15))]
+    assert intersect(first, []) == []
+
+
+def test_free_slots():
+    busy = [(at(9), at(10)), (at(9, 30), at(11)), (at(13), at(14))]
+    slots = free_slots(busy, at(8), at(16), datetime.timedelta(minutes = 30))
+    assert slots == [(at(8), at(9)), (at(11), at(13)), (at(14), at(16))]
+
+
+def test_free_slots_min_duration_and_working_hours():
+    busy = [(at(9), at(9, 45)), (at(10), at(12))]
+    slots = free_slots(busy, at(6), at(23), datetime.timedelta(minutes = 30), datetime.time(8), datetime.time(20))
+    assert slots == [(at(8), at(9)), (at(12), at(20))]
+
+
+def test_free_slots_converts_busy_times_to_the_zone_of_the_range():
+    start = parse_query_time("2025-01-06T08:00:00")
+    end = parse_query_time("2025-01-06T12:00:00")
+    busy = [(at(10, zone = CET), at(11, zone = CET))]
+    slots = free_slots(busy, start, end, datetime.timedelta(minutes = 30))
+    assert [(slot_start.hour, slot_end.hour) for (slot_start, slot_end) in slots] == [(8, 10), (11, 12)]
+    assert format_slots(slots, datetime.timedelta(minutes = 30)) == (
+        "2 free slots:\n2025-01-06 08:00-10:00+01:00 (120 min)\n2025-01-06 11:00-12:00+01:00 (60 min)"
+    )
+
+
+def test_free_slots_busy_in_utc():
+    start = at(8, zone = DEFAULT_ZONE)
+    busy = [(at(9), at(10))]
+    slots = free_slots(busy, start, at(12, zone = DEFAULT_ZONE), datetime.timedelta(minutes = 30))
+    assert slots == [(at(8, zone = DEFAULT_ZONE), at(10, zone = DEFAULT_ZONE)), (at(11, zone = DEFAULT_ZONE), at(12, zone = DEFAULT_ZONE))]
+
+
+def test_query_time_keeps_given_offset():
+    assert parse_query_time("2025-01-06T08:00:00+00:00") == at(8)
+    assert parse_query_time("2025-01-06T08:00:00").utcoffset() == datetime.timedelta(hours = 1)
+
+
+def test_parse_clock():
+    assert parse_clock("8:00") == datetime.time(8)
+    assert parse_clock("08:30") == datetime.time(8, 30)
+    assert parse_clock(" 20:00 ") == datetime.time(20)
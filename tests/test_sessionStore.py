@@ -0,0 +1,28 @@
+from assistants.managerStructure import ManagerState
+from assistants.sessionStore import SessionStore
+
+
+def test_store_without_journal_stays_bounded():
+    store = SessionStore()
+    for turn in range(500):
+        session = store.get("local")
+        state = session.manager_states.setdefault("Manager", ManagerState(token_budget = 200))
+        state.push_user_message(f"question {turn}")
+        state.push_assistant_message(f"answer {turn}")
+        session.add_history(state.messages[-1])
+        store.record_turn(session)
+
+    session = store.get("local")
+    state = session.manager_states["Manager"]
+    assert state.journal_entries == []
+    assert session.unjournaled_history == []
+    assert len(session.history) <= session.history.maxlen
+    assert state.context.total_tokens <= 200
+    store.release(session)
+
+
+def test_released_session_is_evicted_over_the_limit():
+    store = SessionStore(max_sessions = 2)
+    for session_id in ("a", "b", "c"):
+        store.record_turn(store.get(session_id))
+    assert list(store.sessions) == ["b", "c"]
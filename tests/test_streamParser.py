@@ -0,0 +1,59 @@
+from assistants.streamParser import ToolCallDetector
+
+
+def stream(text: str, step: int = 3) -> tuple[ToolCallDetector, str]:
+    # feeds the text in small deltas and collects what would be printed while it arrives
+    detector = ToolCallDetector(["get_events"])
+    printed = ""
+    for index in range(0, len(text), step):
+        mode = detector.feed(text[index:index + step])
+        if mode == "text":
+            printed += detector.take_printable()
+        elif mode == "tool_call" and detector.is_complete:
+            break
+    return detector, printed
+
+
+def test_plain_answer_is_streamed():
+    detector, printed = stream("You have two meetings tomorrow.")
+    assert detector.mode == "text"
+    assert printed == "You have two meetings tomorrow."
+    assert detector.finish() == ""
+
+
+def test_call_is_detected_and_cut_at_its_end():
+    detector, printed = stream('[{"name": "get_events", "arguments": {}}] trailing')
+    assert detector.mode == "tool_call"
+    assert printed == ""
+    assert detector.get_tool_call() == '[{"name": "get_events", "arguments": {}}]'
+
+
+def test_call_in_json_fence():
+    detector, _ = stream('```json\n[{"name": "get_events", "arguments": {}}]\n```')
+    assert detector.mode == "tool_call"
+    assert detector.get_tool_call() == '[{"name": "get_events", "arguments": {}}]'
+
+
+def test_answer_starting_with_code_block_is_streamed():
+    detector, printed = stream("```bash\nls -la\n```\nThat lists the files.")
+    assert detector.mode == "text"
+    assert printed == "```bash\nls -la\n```\nThat lists the files."
+
+
+def test_plain_fence_without_json_is_text():
+    detector, _ = stream("```\nls -la\n```")
+    assert detector.mode == "text"
+    assert detector.finish() is not None
+
+
+def test_call_after_prose_is_held_back():
+    detector, printed = stream('Sure, let me check. [{"name": "get_events", "arguments": {}}]')
+    assert detector.mode == "text"
+    assert printed == "Sure, let me check. "
+    assert detector.finish() is None
+
+
+def test_brackets_in_prose_are_printed_at_the_end():
+    detector, printed = stream("See [the docs](https://example.com) for more.")
+    assert printed == "See "
+    assert detector.finish() == "[the docs](https://example.com) for more."
@@ -0,0 +1,110 @@
+from assistants.toolCallParser import close_open_brackets, json_segments, load_json, parse_tool_calls, repair_json
+
+
+TOOLS = ["get_events", "put_event", "assign_task_to"]
+
+
+def test_plain_call_list():
+    parsed = parse_tool_calls('[{"name": "get_events", "arguments": {"time_from": "2025-01-06", "time_till": "2025-01-13"}}]', TOOLS)
+    assert parsed.kind == "tool_calls"
+    assert parsed.calls == [{"name": "get_events", "arguments": {"time_from": "2025-01-06", "time_till": "2025-01-13"}}]
+
+
+def test_single_object_and_openai_shape():
+    parsed = parse_tool_calls('{"function": {"name": "put_event", "arguments": "{\\"summary\\": \\"Lunch\\"}"}}', TOOLS)
+    assert parsed.kind == "tool_calls"
+    assert parsed.calls == [{"name": "put_event", "arguments": {"summary": "Lunch"}}]
+
+
+def test_tool_calls_key_and_parameters():
+    parsed = parse_tool_calls('{"tool_calls": [{"name": "get_events", "parameters": {"time_from": "a"}}]}', TOOLS)
+    assert parsed.calls == [{"name": "get_events", "arguments": {"time_from": "a"}}]
+
+
+def test_plain_text_answer():
+    parsed = parse_tool_calls("You have two meetings tomorrow.", TOOLS)
+    assert parsed.kind == "text"
+
+
+def test_call_wrapped_in_prose():
+    parsed = parse_tool_calls('Sure, let me check. [{"name": "get_events", "arguments": {}}] One moment.', TOOLS)
+    assert parsed.kind == "tool_calls"
+    assert parsed.calls[0]["name"] == "get_events"
+
+
+def test_call_in_code_fence():
+    parsed = parse_tool_calls('```json\n[{"name": "get_events", "arguments": {}}]\n```', TOOLS)
+    assert parsed.kind == "tool_calls"
+
+
+def test_code_fence_without_call_is_text():
+    parsed = parse_tool_calls("You can list the files with:\n```bash\nls -la ~/calendars\n```", TOOLS)
+    assert parsed.kind == "text"
+
+
+def test_python_snippet_with_dict_is_text():
+    parsed = parse_tool_calls('Like this:\n```python\nconfig = {"retries": 3}\nprint(config)\n```', TOOLS)
+    assert parsed.kind == "text"
+
+
+def test_json_example_for_unknown_name_is_text():
+    parsed = parse_tool_calls('The format looks like {"name": "example", "arguments": {}} in the docs.', TOOLS)
+    assert parsed.kind == "text"
+
+
+def test_unreadable_call_is_malformed():
+    parsed = parse_tool_calls('[{"name": "get_events", "arguments": {"time_from": 2025-01-06}}]', TOOLS)
+    assert parsed.kind == "malformed"
+    assert parsed.error
+
+
+def test_cut_off_call_is_completed():
+    parsed = parse_tool_calls('[{"name": "put_event", "arguments": {"summary": "Dinner", "time_from": "2025-01-08T18:00', TOOLS)
+    assert parsed.kind == "tool_calls"
+    assert parsed.calls[0]["arguments"] == {"summary": "Dinner", "time_from": "2025-01-08T18:00"}
+
+
+def test_python_literals_outside_strings_only():
+    text = "{'name': 'put_event', 'arguments': {'summary': 'None of the above', 'description': 'True crime', 'all_day': False}}"
+    parsed = parse_tool_calls(text, TOOLS)
+    assert parsed.calls[0]["arguments"] == {"summary": "None of the above", "description": "True crime", "all_day": False}
+
+
+def test_unquoted_keys_outside_strings_only():
+    assert load_json('{"summary": "Lunch, note: bring cake",}') == {"summary": "Lunch, note: bring cake"}
+    assert load_json("{name: 'get_events', arguments: {max_results: 5}}") == {"name": "get_events", "arguments": {"max_results": 5}}
+
+
+def test_trailing_commas():
+    assert load_json('{"a": [1, 2, ], "b": {"c": 1, }, }') == {"a": [1, 2], "b": {"c": 1}}
+
+
+def test_single_quoted_string_with_apostrophe():
+    assert load_json("{'summary': 'Bob's party'}") == {"summary": "Bob's party"}
+
+
+def test_double_quotes_inside_single_quoted_string():
+    assert load_json("{'summary': 'The \"big\" meeting'}") == {"summary": 'The "big" meeting'}
+
+
+def test_smart_quotes():
+    assert load_json("{“name”: “get_events”}") == {"name": "get_events"}
+    # inside a normal string they are part of the text
+    assert load_json('{"summary": "He said “hi”",}') == {"summary": "He said “hi”"}
+
+
+def test_raw_line_break_in_string():
+    assert load_json('{"description": "first line\nsecond line",}') == {"description": "first line\nsecond line"}
+
+
+def test_repair_keeps_escapes():
+    assert load_json(repair_json('{"summary": "a \\"quoted\\" word"}')) == {"summary": 'a "quoted" word'}
+
+
+def test_close_open_brackets():
+    assert close_open_brackets('[{"name": "x", "arguments": {"a": "b') == '[{"name": "x", "arguments": {"a": "b"}}]'
+    assert close_open_brackets('{"a": 1,') == '{"a": 1}'
+
+
+def test_json_segments():
+    assert json_segments('text {"a": "}"} more [1, 2] and {"open": ') == ['{"a": "}"}', "[1, 2]", '{"open": ']